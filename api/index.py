@@ -1,14 +1,28 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
+import sys
 import requests
 import json
 from dotenv import load_dotenv
 
+# Shared helper modules live at the project root, one level above api/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import assignment_grading
+import chat_memory
+import circuit_breaker
+import llm_client
+import metrics
+import notes_retrieval
+import upstream_limits
+import user_directory
+
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
+metrics.init_app(app)
+app.register_error_handler(upstream_limits.Overloaded, upstream_limits.overloaded_response)
 
 @app.route('/api/chatbot', methods=['POST'])
 def chatbot():
@@ -27,28 +41,28 @@ def chatbot():
         "and do not write huge paragraphs."
     )}]
     
-    conversation.extend(chat_history)
-    conversation.append({"role": "user", "content": f"{user_message}\n\nNotes:\n{notes}"})
-
-    model_api_key = os.getenv("MISTRAL_API_KEY")
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {model_api_key}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": "mistralai/devstral-2512:free",
-            "messages": conversation
-        })
+    history, history_info = chat_memory.compact(chat_history)
+    conversation.extend(history)
+    context, context_info = notes_retrieval.select_context(
+        notes, notes_retrieval.retrieval_query(user_message, chat_history)
     )
-    if response.status_code != 200:
-        return jsonify({"error": "Chatbot API failed"}), 500
+    conversation.append({"role": "user", "content": f"{user_message}\n\nNotes:\n{context}"})
+    meta = {"notes_context": context_info, "history": history_info}
+
+    # Streaming variant: relay tokens as server-sent events as they arrive
+    if data.get("stream"):
+        return Response(
+            stream_with_context(llm_client.chat_sse(conversation, meta=meta, site="chat")),
+            mimetype="text/event-stream",
+            headers=llm_client.SSE_HEADERS,
+        )
 
-    data = response.json()
-    answer = data["choices"][0]["message"]["content"]
+    try:
+        answer = llm_client.complete(conversation, site="chat")
+    except llm_client.LLMError:
+        return jsonify({"error": "Chatbot API failed"}), 500
 
-    return jsonify({"answer": answer})
+    return jsonify(dict(meta, answer=answer))
 
 @app.route('/api/leave-class', methods=['POST'])
 def leave_class():
@@ -74,7 +88,9 @@ def leave_class():
 
     url = f"{supabase_url}/rest/v1/class_enrollments?student_id=eq.{student_id}&class_id=eq.{class_id}"
     
-    response = requests.delete(url, headers=headers)
+    with circuit_breaker.guard("supabase", "class_enrollments") as call:
+        response = requests.delete(url, headers=headers, timeout=30)
+        call.status = response.status_code
 
     if response.status_code >= 200 and response.status_code < 300:
         return jsonify({"message": "Successfully left class", "details": response.json() if response.content else {}})
@@ -114,25 +130,10 @@ The JSON structure must be:
 Ensure questions are high-quality, clear, and relevant to the topic.
 """
     
-    model_api_key = os.getenv("MISTRAL_API_KEY")
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {model_api_key}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": "mistralai/devstral-2512:free",
-            "messages": [
-            {
-                "role": "user",
-                "content": content + "\n\nTopic: " + topic
-            }
-            ]
-        })
-    )
-    data = response.json()
-    raw_output = data["choices"][0]["message"]["content"]
+    try:
+        raw_output = llm_client.complete(content + "\n\nTopic: " + topic, site="questions")
+    except llm_client.LLMError:
+        return jsonify({"error": "Question generation API failed"}), 500
     
     lines = raw_output.strip().split("\n")
     if len(lines) > 2 and lines[0].startswith("```") and lines[-1].startswith("```"):
@@ -149,94 +150,42 @@ Ensure questions are high-quality, clear, and relevant to the topic.
 
 @app.route('/api/evaluate-answer', methods=['POST'])
 def evaluate_answer():
-    data = request.json
-    question_text = data.get('question', '')
-    user_answer = data.get('user_answer', '')
-    correct_answer = data.get('correct_answer', '')
-
-    if not question_text or not user_answer:
-        return jsonify({"error": "Missing question or answer"}), 400
-
-    prompt = (
-        "You are an expert teacher grading a student's answer.\n"
-        f"Question: {question_text}\n"
-        f"Student Answer: {user_answer}\n"
-        f"Target Concept/Answer: {correct_answer}\n\n"
-        "Task:\n"
-        "1. Determine if the student's answer is essentially correct. Be generous with phrasing but strict on facts.\n"
-        "2. Provide short, constructive feedback (max 2 sentences).\n\n"
-        "Output JSON ONLY:\n"
-        "{ \"correct\": boolean, \"feedback\": \"string\" }"
-    )
+    return assignment_grading.evaluate_answer_response(request.json or {})
 
-    model_api_key = os.getenv("MISTRAL_API_KEY")
-    try:
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {model_api_key}",
-                "Content-Type": "application/json",
-            },
-            data=json.dumps({
-                "model": "mistralai/devstral-2512:free",
-                "messages": [{"role": "user", "content": prompt}],
-                "response_format": {"type": "json_object"}
-            })
-        )
-        data = response.json()
-        content = data["choices"][0]["message"]["content"]
-        result = json.loads(content)
-        return jsonify(result)
-    except Exception as e:
-        is_correct = correct_answer.lower() in user_answer.lower() if correct_answer else False
-        return jsonify({"correct": is_correct, "feedback": "AI evaluation failed, falling back to simple check."})
+
+@app.route('/api/evaluate-answers', methods=['POST'])
+def evaluate_answers():
+    return assignment_grading.evaluate_answers_response(
+        request.json or {}, request.headers.get('Authorization')
+    )
 
 @app.route('/api/get-users', methods=['GET'])
 def get_users():
     try:
-        supabase_url = os.getenv("SUPABASE_URL")
-        
-        service_role_key_env = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        anon_key_env = os.getenv("SUPABASE_KEY")
-        service_key = service_role_key_env or anon_key_env
-
-        if not supabase_url or not service_key:
-            return jsonify({"error": "Missing Supabase configuration in .env"}), 500
-
-        admin_url = f"{supabase_url}/auth/v1/admin/users"
-        
-        headers = {
-            "apikey": service_key,
-            "Authorization": f"Bearer {service_key}",
-            "Content-Type": "application/json"
-        }
-
-        # Fetch first page only for simplicity in serverless (avoid timeouts)
-        response = requests.get(
-            f"{admin_url}?page=1&per_page=100",
-            headers=headers
-        )
+        snapshot = user_directory.directory.get(force=request.args.get('refresh') == '1')
+    except upstream_limits.Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return user_directory.snapshot_response(snapshot)
 
-        if response.status_code != 200:
-            return jsonify({"error": "Failed to fetch users from Supabase"}), 500
-
-        data = response.json()
-        users_page = data.get("users", [])
-        
-        formatted_users = []
-        for u in users_page:
-            uid = u.get("id")
-            email = u.get("email")
-            meta = u.get("user_metadata", {})
-            name = meta.get("full_name") or meta.get("name") or "Student"
-            
-            formatted_users.append({
-                "id": uid,
-                "email": email,
-                "name": name
-            })
-
-        return jsonify(formatted_users)
 
+@app.route('/api/users/search', methods=['GET'])
+def search_users():
+    try:
+        snapshot = user_directory.directory.get()
+    except upstream_limits.Overloaded:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    return user_directory.search_response(snapshot, request.args)
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    return metrics.metrics_response()
+
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify(dict(circuit_breaker.health(), llm=llm_client.hedge_stats.stats()))
@@ -1,38 +1,75 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
-from google import genai
-from google.genai import types
-from pathlib import Path
-import subprocess
 import os
 import json
 import requests
-import mimetypes
-import shutil
-import threading
+import re
+import time
+import uuid
 from dotenv import load_dotenv
-from gtts import gTTS
+import assignment_grading
+import chat_memory
+import circuit_breaker
+import image_prep
+import llm_client
+import metrics
+import notes_retrieval
+import ocr
+import upstream_limits
+import user_directory
+import video_delivery
+import video_jobs
+import video_pipeline
+import voiceover
+from cache import SingleFlight, TTLCache
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
+metrics.init_app(app)
+app.register_error_handler(upstream_limits.Overloaded, upstream_limits.overloaded_response)
 
-UPLOAD_FOLDER = "uploads"
 RESULTS_FOLDER = "results"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
 
-def clear_folder(folder_path):
-    """Delete all files in a folder but keep the folder itself."""
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
+# Reject oversized uploads before they are buffered (413)
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
 
-        if os.path.isfile(file_path):
-            os.remove(file_path)
-        elif os.path.isdir(file_path):
-            shutil.rmtree(file_path)
+RESULT_KEY_RE = re.compile(r"^[0-9a-f]{32}$")
+RESULT_RETENTION_SECONDS = float(os.getenv("RESULT_RETENTION_HOURS", "24")) * 3600
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit_mb = app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)
+    return jsonify({"error": f"Upload too large (limit {limit_mb} MB)"}), 413
+
+
+def save_result(text, result_key=None):
+    """Write extracted notes under a per-request key and return the key."""
+    result_key = result_key or uuid.uuid4().hex
+    path = os.path.join(RESULTS_FOLDER, f"{result_key}.txt")
+    # Write then rename so readers never see a half-written file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return result_key
+
+
+def prune_results():
+    """Delete per-request result files older than the retention window."""
+    cutoff = time.time() - RESULT_RETENTION_SECONDS
+    for entry in os.scandir(RESULTS_FOLDER):
+        if not RESULT_KEY_RE.match(entry.name.split(".", 1)[0]):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
 
 
 @app.route('/chatbot', methods=['POST'])
@@ -42,8 +79,9 @@ def chatbot():
       - notes: The converted notes text
       - user_message: The user's question
       - chat_history: optional list of previous messages [{role, content}]
+      - stream: optional, if true the answer is streamed as server-sent events
     Returns:
-      - chatbot response
+      - answer, plus notes_context and history describing what was sent
     """
     data = request.json
     notes = data.get("notes", "")
@@ -61,31 +99,32 @@ def chatbot():
         "and do not write huge paragraphs."
     )}]
     
-    # Add previous chat messages if any
-    conversation.extend(chat_history)
+    # Add previous chat messages, older turns folded into a summary if over budget
+    history, history_info = chat_memory.compact(chat_history)
+    conversation.extend(history)
     
-    # Add current user message
-    conversation.append({"role": "user", "content": f"{user_message}\n\nNotes:\n{notes}"})
-
-    model_api_key = os.getenv("MISTRAL_API_KEY")
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {model_api_key}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": "mistralai/devstral-2512:free",
-            "messages": conversation
-        })
+    # Only the parts of the notes relevant to this question are sent
+    context, context_info = notes_retrieval.select_context(
+        notes, notes_retrieval.retrieval_query(user_message, chat_history)
     )
-    if response.status_code != 200:
-        return jsonify({"error": "Chatbot API failed"}), 500
+    conversation.append({"role": "user", "content": f"{user_message}\n\nNotes:\n{context}"})
+    meta = {"notes_context": context_info, "history": history_info}
+
+    # Streaming variant: relay tokens as server-sent events as they arrive
+    if data.get("stream"):
+        return Response(
+            stream_with_context(llm_client.chat_sse(conversation, meta=meta, site="chat")),
+            mimetype="text/event-stream",
+            headers=llm_client.SSE_HEADERS,
+        )
 
-    data = response.json()
-    answer = data["choices"][0]["message"]["content"]
+    try:
+        answer = llm_client.complete(conversation, site="chat")
+    except llm_client.LLMError as e:
+        print(f"Chatbot API failed: {e}")
+        return jsonify({"error": "Chatbot API failed"}), 500
 
-    return jsonify({"answer": answer})
+    return jsonify(dict(meta, answer=answer))
 
 
 @app.route('/leave-class', methods=['POST'])
@@ -114,23 +153,32 @@ def leave_class():
     # PostgREST Delete
     url = f"{supabase_url}/rest/v1/class_enrollments?student_id=eq.{student_id}&class_id=eq.{class_id}"
     
-    response = requests.delete(url, headers=headers)
+    with circuit_breaker.guard("supabase", "class_enrollments") as call:
+        response = requests.delete(url, headers=headers, timeout=30)
+        call.status = response.status_code
 
     if response.status_code >= 200 and response.status_code < 300:
         return jsonify({"message": "Successfully left class", "details": response.json() if response.content else {}})
     else:
         return jsonify({"error": "Failed to leave class", "details": response.text}), response.status_code
 
-@app.route('/create-questions', methods=['POST'])
-def create_questions():
-    # Get topic and parameters from request body
-    data = request.get_json()
-    topic = data.get("topic")
-    # Default to 5 if not provided, for normal practice
-    count = data.get("count", 5)
-    # Default to all if not provided
-    question_types = data.get("types", []) 
-    
+QUESTION_CACHE_TTL = float(os.getenv("QUESTION_CACHE_TTL", "600"))
+question_cache = TTLCache(maxsize=int(os.getenv("QUESTION_CACHE_SIZE", "256")), ttl=QUESTION_CACHE_TTL)
+question_flight = SingleFlight()
+
+
+def question_cache_key(topic, count, question_types):
+    """Normalize request parameters so trivially different requests share a set."""
+    normalized_topic = " ".join(str(topic).split()).lower()
+    normalized_types = tuple(sorted({str(t).strip().lower() for t in question_types or []}))
+    return (normalized_topic, str(count).strip(), normalized_types)
+
+
+def build_question_set(topic, count, question_types):
+    """
+    Ask the LLM for a question set and parse it.
+    Returns (body, status_code); only status 200 bodies are worth caching.
+    """
     # Map friendly names to internals if needed, or just pass strings
     # The prompt expects: "multiple-choice, true/false, short answer/free response, and word problems"
     # If types are provided, format them for the prompt.
@@ -158,31 +206,14 @@ def create_questions():
     )
     # ------------------------------------------------------------------
 
-    model_api_key = os.getenv("MISTRAL_API_KEY")
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {model_api_key}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": "mistralai/devstral-2512:free",
-            "messages": [
-            {
-                "role": "user",
-                "content": content + topic
-            }
-            ]
-        })
-    )
-    data = response.json()
-
-    # # Extract the assistant message content
-    raw_output = data["choices"][0]["message"]["content"]
+    try:
+        raw_output = llm_client.complete(content + topic, site="questions")
+    except llm_client.LLMError as e:
+        print(f"Question generation failed: {e}")
+        return {"error": "Question generation API failed"}, 500
 
     print("raw_output: " + raw_output)
 
-    lines = raw_output.strip().split("\n")
     # Remove first and last lines (backticks)
     lines = raw_output.strip().split("\n")
     if len(lines) > 2:
@@ -195,163 +226,114 @@ def create_questions():
         questions_json = json.loads(middle)
     except json.JSONDecodeError as e:
         print("JSON decode error:", e)
-        return jsonify({"error": "Failed to parse questions JSON", "raw": middle}), 500
+        return {"error": "Failed to parse questions JSON", "raw": middle}, 500
 
     print(middle)
-    # Return JSON directly
-    return jsonify(questions_json)
+    return questions_json, 200
 
-def generate_title(text):
-    model_api_key = os.getenv("MISTRAL_API_KEY")
-    response = requests.post(
-    url="https://openrouter.ai/api/v1/chat/completions",
-    headers={
-        "Authorization": f"Bearer {model_api_key}",
-        "Content-Type": "application/json",
-    },
-    data=json.dumps({
-        "model": "mistralai/devstral-2512:free",
-        "messages": [
-        {
-            "role": "user",
-            "content": '''Carefully review the text provided and generate a viable TITLE for the topic that the content is on. The content should be 10-12 words MAXIMUM, it can be shorter as needed.
-                Do not include any other extra text like 'okay here's your message' or something similar. ONLY include the title.''' + text
-        }
-        ]
-    })
-    )
-    data = response.json()
 
-    # # Extract the assistant message content
-    llm_output = data["choices"][0]["message"]["content"]
+@app.route('/create-questions', methods=['POST'])
+def create_questions():
+    # Get topic and parameters from request body
+    data = request.get_json()
+    topic = data.get("topic")
+    # Default to 5 if not provided, for normal practice
+    count = data.get("count", 5)
+    # Default to all if not provided
+    question_types = data.get("types", []) 
+    # Skip the shared cache when the caller wants a new variation
+    fresh = bool(data.get("fresh", False))
+
+    if not topic:
+        return jsonify({"error": "No topic provided"}), 400
 
-    return llm_output
+    key = question_cache_key(topic, count, question_types)
 
-def convert_to_latex(text):
-    model_api_key = os.getenv("MISTRAL_API_KEY")
-    response = requests.post(
-    url="https://openrouter.ai/api/v1/chat/completions",
-    headers={
-        "Authorization": f"Bearer {model_api_key}",
-        "Content-Type": "application/json",
-    },
-    data=json.dumps({
-        "model": "mistralai/devstral-2512:free",
-        "messages": [
-        {
-            "role": "user",
-            "content": '''Convert the text below into a LaTeX document.
-                After converting, carefully review the text and correct any mistakes
-                or misread characters. Preserve formatting like bullet points,
-                headings, or mathematical notation where possible.
-                Do not include any other extra text like 'okay here's your message' or something similar. ONLY include the extracted LaTeX output.''' + text
-        }
-        ]
-    })
-    )
-    data = response.json()
+    def generate():
+        body, status = build_question_set(topic, count, question_types)
+        if status == 200:
+            question_cache.set(key, body)
+        return body, status
 
-    # # Extract the assistant message content
-    llm_output = data["choices"][0]["message"]["content"]
+    if fresh:
+        body, status = generate()
+    else:
+        body = question_cache.get(key)
+        if body is not None:
+            return jsonify(body)
+        # Identical requests arriving together share one upstream call
+        body, status = question_flight.do(key, generate)
+
+    # Return JSON directly
+    return jsonify(body), status
+
+def generate_title(text):
+    return llm_client.complete(
+        '''Carefully review the text provided and generate a viable TITLE for the topic that the content is on. The content should be 10-12 words MAXIMUM, it can be shorter as needed.
+                Do not include any other extra text like 'okay here's your message' or something similar. ONLY include the title.''' + text,
+        site="title",
+    )
 
-    return llm_output
-    
 @app.route('/extract-text', methods=['POST'])
 def extractText():
-    # 1. Clear uploads and results folders
-    clear_folder(UPLOAD_FOLDER)
-    clear_folder(RESULTS_FOLDER)
-
     # --- 1. Handle multiple uploaded images ---
     uploaded_files = request.files.getlist('images')
 
     if not uploaded_files or uploaded_files == [None]:
         return jsonify({"error": "No images uploaded"}), 400
 
+    # Read each upload straight from the multipart stream, keeping upload
+    # order so pages are stitched back in the order they were sent
+    pages = []
     for file in uploaded_files:
         if file.filename == "":
             continue
         
         filename = secure_filename(file.filename)
-        save_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(save_path)
-        print(f"Saved uploaded image: {save_path}")
-
-    API_KEY = os.getenv("GOOGLE_API_KEY")
-    client = genai.Client(api_key=API_KEY)
+        mime_type = image_prep.mime_type_for(filename)
 
-    extracted_text = ""
-    for filename in os.listdir(UPLOAD_FOLDER):
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-
-        # Skip directories
-        if not os.path.isfile(file_path):
+        # Accept JPEG/PNG/WebP/HEIC images and PDFs
+        if mime_type is None:
+            print(f"Skipping unsupported file: {filename}")
             continue
 
-        mime_type, _ = mimetypes.guess_type(file_path)
+        pages.append({"filename": filename, "mime_type": mime_type, "data": file.read()})
+        print(f"Received upload: {filename}")
 
-        # Accept only JPEG/PNG images
-        if mime_type not in ("image/jpeg", "image/png"):
-            print(f"Skipping non-image file: {filename}")
-            continue
+    # Repeat uploads are answered from the OCR cache by their raw hash; the
+    # rest are oriented, downscaled and recompressed in worker processes
+    # (PDFs split into pages) and each page goes to OCR as soon as it is ready
+    page_results = ocr.extract_uploads(pages, prepare=image_prep.iter_pages)
+    # 429/503 with Retry-After only when no page got through at all
+    upstream_limits.raise_if_all_rejected(page_results)
+    extracted_text = ocr.join_pages(page_results)
 
-        print(f"\nProcessing image: {filename}")
-
-        with open(file_path, 'rb') as f:
-            image_bytes = f.read()
-
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=[
-                types.Part.from_bytes(
-                    data=image_bytes,
-                    mime_type=mime_type,
-                ),
-                (
-                    "Extract all the text from this image and "
-                    "After extracting, carefully review the text and correct any mistakes "
-                    "or misread characters. THEN, CONVERT the text into a neatly formatted notes with logical understanding."
-                    " Do not include any other extra text like 'okay here's your message' or something similar. ONLY include the neatly formatted output."
-                )
-            ]
-        )
-        extracted_text += response.text + "\n"
+    if pages and not extracted_text:
+        return jsonify({"error": "Failed to extract text from images", "pages": ocr.summarize_pages(page_results)}), 500
     
-    # Save to file
-    results_file_path = os.path.join(RESULTS_FOLDER, "results.txt")
-    with open(results_file_path, "w", encoding="utf-8") as f:
-        f.write(extracted_text)
+    # Save to a per-request file so concurrent uploads never overwrite each other
+    prune_results()
+    result_key = save_result(extracted_text)
 
-    print(f"\nAll results saved to {results_file_path}")
+    print(f"\nAll results saved under result key {result_key}")
     
     #generate a title and return that too
-    notes_title = generate_title(extracted_text)
+    try:
+        notes_title = generate_title(extracted_text)
+    except (llm_client.LLMError, upstream_limits.Overloaded) as e:
+        # The notes are already saved; a missing title must not lose the result_key
+        print(f"Title generation failed: {e}")
+        notes_title = "Untitled Note"
 
     # Return the extracted text in the response
     return jsonify({
         "status": "success",
         "extracted_text": extracted_text,
         "notes_title" : notes_title,
+        "result_key": result_key,
+        "pages": ocr.summarize_pages(page_results),
     })
 
-def background_video_creation(user_text):
-    # Sanitize user input to prevent LaTeX errors
-    if user_text:
-        user_text = user_text.replace("&", "and").replace("%", " percent ")
-
-    try:
-        # Correct path where Manim saves the output
-        video_path = Path("media/videos/generated_manim_script/1080p60/Explainer.mp4")
-        if video_path.exists():
-            video_path.unlink()
-            print(f"Deleted old video at: {video_path}")
-        else:
-            print("No old video to delete.")
-        createVideo(user_text)
-        print("Video generation finished!")
-    except Exception as e:
-        print("Error generating video:", e)
-    
 @app.route('/generate-video', methods=['POST'])
 def generate_video():
     data = request.json
@@ -359,192 +341,110 @@ def generate_video():
     if not user_text:
         return jsonify({"error": "No text provided"}), 400
     
-    # Start the video generation in a separate thread
-    thread = threading.Thread(target=background_video_creation, args=(user_text,))
-    thread.start()
+    # Queue the render; video_worker.py picks it up in its own process.
+    # "preview" (default VIDEO_PREVIEW) renders a quick -ql tier first.
+    job = video_jobs.enqueue(user_text, preview=data.get('preview'))
     
     # Immediately respond to the client
-    return jsonify({"status": "started"})
+    return jsonify({"status": "started", "job_id": job["id"]})
+
+@app.route('/video-jobs/<job_id>', methods=['GET'])
+def get_video_job(job_id):
+    """Status of a queued or finished video job, including which tiers are ready"""
+    job = video_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(video_jobs.public_view(job))
+
+@app.route('/video-jobs/<job_id>/result', methods=['GET'])
+def get_video_job_result(job_id):
+    """
+    Serve the rendered video for a specific job.
+    ?tier=preview|final|best (default best: the final render once it exists,
+    the preview until then). The X-Video-Tier header says which was sent.
+    """
+    job = video_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    tier = request.args.get("tier", "best")
+    # A specific tier of a job never changes once rendered, so it can be cached
+    cache_control = "no-cache" if tier == "best" else "public, max-age=86400"
+    return send_job_video(job, tier, cache_control)
 
 @app.route('/video', methods=['GET'])
 def get_video():
-    """Serve the generated video file"""
-    video_path = Path("media/videos/generated_manim_script/1080p60/Explainer.mp4")
-    
-    if not video_path.exists():
+    """
+    Serve a generated video file.
+    With ?job_id= serves that job; otherwise serves the most recently
+    submitted job. Defaults to the final render (404 while it is still
+    rendering) so existing pollers keep working; pass ?tier=best or
+    ?tier=preview to get the preview while the final is in progress.
+    """
+    job_id = request.args.get("job_id")
+    job = video_jobs.get_job(job_id) if job_id else video_jobs.latest_job()
+    if job is None:
         return jsonify({"error": "Video not found"}), 404
+    return send_job_video(job, request.args.get("tier", video_jobs.FINAL))
+
+def send_job_video(job, tier, cache_control="no-cache"):
+    if tier not in (video_jobs.PREVIEW, video_jobs.FINAL, "best"):
+        return jsonify({"error": "tier must be preview, final or best"}), 400
+
+    served_tier, video_path = video_jobs.video_path_for(job, tier)
+    if video_path is None:
+        return jsonify({
+            "error": "Video not ready",
+            "status": job["status"],
+            "tiers_available": video_jobs.available_tiers(job),
+        }), 404
     
-    return send_file(
-        video_path,
-        mimetype='video/mp4',
-        as_attachment=False,
-        download_name='Explainer.mp4'
-    )
-
-def createVideo(user_text_here):
-    with open("./src/assets/video_prompt.txt", "r") as file:
-        content = file.read()
-    model_api_key = os.getenv("MISTRAL_API_KEY")
-    response = requests.post(
-    url="https://openrouter.ai/api/v1/chat/completions",
-    headers={
-        "Authorization": f"Bearer {model_api_key}",
-        "Content-Type": "application/json",
-    },
-    data=json.dumps({
-        "model": "mistralai/devstral-2512:free",
-        "messages": [
-        {
-            "role": "user",
-            "content": content + convert_to_latex(user_text_here)
-        }
-        ]
-    })
-    )
-    data = response.json()
-
-    print("API Response:", json.dumps(data, indent=2))
+    # Range requests, ETag/Last-Modified revalidation and sendfile delivery
+    response = video_delivery.send_video(video_path, 'Explainer.mp4', cache_control)
+    response.headers["X-Video-Tier"] = served_tier
+    return response
 
-    if "error" in data:
-        raise ValueError(f"API Error: {data['error']}")
 
-    if "choices" not in data:
-        raise ValueError(f"Unexpected API response format: {data}")
+@app.route('/evaluate-answer', methods=['POST'])
+def evaluate_answer():
+    return assignment_grading.evaluate_answer_response(request.json or {})
 
-    llm_output = data["choices"][0]["message"]["content"]
 
-    # 1. Parse Voiceover
-    if "VOICEOVER_SCRIPT" in llm_output and "END_VOICEOVER" in llm_output:
-        try:
-            voice_part = llm_output.split("VOICEOVER_SCRIPT", 1)[1]
-            voice_text = voice_part.split("END_VOICEOVER", 1)[0].strip()
-            
-            # Generate MP3 using gTTS
-            print(f"Generating voiceover ({len(voice_text)} chars) with gTTS...")
-            
-            # Generate base audio with gTTS
-            tts = gTTS(text=voice_text, lang='en', slow=False)
-            tts.save('voiceover_temp.mp3')
-            
-            # Speed up audio to 1.5x using ffmpeg
-            subprocess.run([
-                'ffmpeg', '-y', '-i', 'voiceover_temp.mp3',
-                '-filter:a', 'atempo=1.5',
-                'voiceover.mp3'
-            ], check=True, capture_output=True)
-            
-            # Clean up temp file
-            if os.path.exists('voiceover_temp.mp3'):
-                os.remove('voiceover_temp.mp3')
-            
-            # Verify file exists and has content
-            if os.path.exists("voiceover.mp3") and os.path.getsize("voiceover.mp3") > 0:
-                 print(f"voiceover.mp3 saved successfully. Size: {os.path.getsize('voiceover.mp3')} bytes")
-            else:
-                 print("Error: voiceover.mp3 is empty or missing.")
-
-        except Exception as e:
-            print(f"Error generating voiceover: {e}")
-    else:
-        print("No VOICEOVER_SCRIPT found in LLM output.")
-
-    if "Manim" not in llm_output:
-        raise ValueError("LLM did not return a valid script with 'Manim' marker.")
-
-    script_text = llm_output.split("Manim", 1)[1].strip()
-
-    # Remove code fences (``` or ```python)
-    if script_text.startswith("```"):
-        # Split by newline after the first ``` line
-        lines = script_text.splitlines()
-        if lines[0].startswith("```"):
-            lines = lines[1:]  # remove opening ```
-        if lines[-1].startswith("```"):
-            lines = lines[:-1]  # remove closing ```
-        script_text = "\n".join(lines).strip()
-
-    # -------------------------------------------------------------
-    # 2. Use a fixed script name — delete if it already exists
-    # -------------------------------------------------------------
-    script_name = "generated_manim_script.py"
-    script_path = Path(script_name)
-
-    if script_path.exists():
-        script_path.unlink()  # delete old file
-
-    # Write new script
-    with open(script_path, "w", encoding="utf-8") as f:
-        f.write(script_text)
-
-    project_root = Path(__file__).parent
-    # venv_python = project_root / ".venv" / "bin" / "python"
-    venv_manim  = project_root / ".venv" / "bin" / "manim"
-
-    if not venv_manim.exists():
-        raise RuntimeError("Manim is not installed inside .venv.")
-
-    subprocess.run(
-        [
-            str(venv_manim),
-            "-qh",
-            script_name,
-            "Explainer"
-        ],
-        cwd=project_root,
-        check=True
+@app.route('/evaluate-answers', methods=['POST'])
+def evaluate_answers():
+    """
+    Grade a batch of answers; with assignment_id, save the student's
+    progress using their Supabase token (Authorization: Bearer ...).
+    """
+    return assignment_grading.evaluate_answers_response(
+        request.json or {}, request.headers.get('Authorization')
     )
-    print("==== Extracted Script Start ====")
-    print(script_text[:200])  # first 200 chars
-    print("==== Extracted Script End ====")
 
-     #return llm_output
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Route latency, in-flight requests and upstream call timings (Prometheus text format)."""
+    return metrics.metrics_response()
 
 
-@app.route('/evaluate-answer', methods=['POST'])
-def evaluate_answer():
-    data = request.json
-    question_text = data.get('question', '')
-    user_answer = data.get('user_answer', '')
-    correct_answer = data.get('correct_answer', '') # Optional, if available
-
-    if not question_text or not user_answer:
-        return jsonify({"error": "Missing question or answer"}), 400
-
-    prompt = (
-        "You are an expert teacher grading a student's answer.\n"
-        f"Question: {question_text}\n"
-        f"Student Answer: {user_answer}\n"
-        f"Target Concept/Answer: {correct_answer}\n\n"
-        "Task:\n"
-        "1. Determine if the student's answer is essentially correct based on the target concept. Be generous with phrasing but strict on facts.\n"
-        "2. Provide short, constructive feedback (max 2 sentences).\n\n"
-        "Output JSON ONLY:\n"
-        "{ \"correct\": boolean, \"feedback\": \"string\" }"
-    )
+@app.route('/health', methods=['GET'])
+def health():
+    """Circuit breaker and limiter state per upstream, plus LLM hedging per call site."""
+    return jsonify(dict(circuit_breaker.health(), llm=llm_client.hedge_stats.stats()))
 
-    model_api_key = os.getenv("MISTRAL_API_KEY")
-    try:
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {model_api_key}",
-                "Content-Type": "application/json",
-            },
-            data=json.dumps({
-                "model": "mistralai/devstral-2512:free",
-                "messages": [{"role": "user", "content": prompt}],
-                "response_format": {"type": "json_object"}
-            })
-        )
-        data = response.json()
-        content = data["choices"][0]["message"]["content"]
-        result = json.loads(content)
-        return jsonify(result)
-    except Exception as e:
-        print(f"Error evaluating answer: {e}")
-        # Fallback to simple containment check if AI fails
-        is_correct = correct_answer.lower() in user_answer.lower() if correct_answer else False
-        return jsonify({"correct": is_correct, "feedback": "AI evaluation failed, falling back to simple check."})
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters and sizes for the server-side caches."""
+    return jsonify({
+        "ocr": ocr.ocr_cache.stats(),
+        "questions": dict(question_cache.stats(), coalesced=question_flight.coalesced),
+        "verdicts": dict(assignment_grading.verdict_cache.stats(),
+                         coalesced=assignment_grading.verdict_flight.coalesced),
+        "renders": video_pipeline.render_cache.stats(),
+        "voiceovers": voiceover.audio_cache.stats(),
+        "users": user_directory.directory.stats(),
+        "notes_indexes": notes_retrieval.index_cache.stats(),
+        "chat_summaries": chat_memory.summary_cache.stats(),
+    })
 
 @app.route('/save-changed-notes', methods=['POST'])
 def save_changed_notes():
@@ -552,17 +452,21 @@ def save_changed_notes():
     try:
         data = request.json
         content = data.get('changedNotes')
-        filename = data.get('filename', 'results.txt')
+        result_key = data.get('result_key')
         
         if not content:
             return jsonify({'error': 'No content provided'}), 400
+
+        if result_key is None:
+            # No key yet, so store the notes under a new one
+            result_key = save_result(content)
+        elif not RESULT_KEY_RE.match(result_key):
+            return jsonify({'error': 'Invalid result_key'}), 400
+        else:
+            save_result(content, result_key)
         
-        filepath = os.path.join(RESULTS_FOLDER, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        print(f"Saved content to {filepath}")
-        return jsonify({'success': True, 'message': 'Content saved successfully'}), 200
+        print(f"Saved content under result key {result_key}")
+        return jsonify({'success': True, 'message': 'Content saved successfully', 'result_key': result_key}), 200
     
     except Exception as e:
         print(f"Error in save-changed-notes: {str(e)}")
@@ -572,89 +476,44 @@ def save_changed_notes():
 @app.route('/get-users', methods=['GET'])
 def get_users():
     """
-    Fetches all users from Supabase Auth Admin API.
-    Requires SUPABASE_SERVICE_ROLE_KEY or SUPABASE_KEY (if it has admin rights) in .env.
-    Returns:
-        JSON list of users: { id, email, name }
+    Returns every user from Supabase Auth as a JSON list of { id, email, name }.
+    Served from the in-memory user directory, which pages through the Auth
+    Admin API concurrently and refreshes in the background. Requires
+    SUPABASE_SERVICE_ROLE_KEY (or a SUPABASE_KEY with admin rights) in .env.
+    Supports If-None-Match; ?refresh=1 forces a reload.
     """
-    print("--- /get-users called ---")
     try:
-        # Prefer SERVICE_ROLE_KEY for admin tasks, fallback to standard KEY
-        supabase_url = os.getenv("SUPABASE_URL")
-        
-        service_role_key_env = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        anon_key_env = os.getenv("SUPABASE_KEY")
-        
-        # Ensure your .env has SUPABASE_SERVICE_ROLE_KEY for this to work
-        service_key = service_role_key_env or anon_key_env
-
-        print(f"Supabase URL found: {bool(supabase_url)}")
-        print(f"Has SUPABASE_SERVICE_ROLE_KEY: {bool(service_role_key_env)}")
-        print(f"Has SUPABASE_KEY: {bool(anon_key_env)}")
-        print(f"Using Key: {'Service Role Key' if service_role_key_env else 'Anon Key (Likely Insufficient)'}")
-
-        if not supabase_url or not service_key:
-            print("Error: Missing keys")
-            return jsonify({"error": "Missing Supabase configuration in .env"}), 500
+        snapshot = user_directory.directory.get(force=request.args.get('refresh') == '1')
+    except upstream_limits.Overloaded:
+        raise
+    except Exception as e:
+        print(f"Error in /get-users: {e}")
+        return jsonify({"error": str(e)}), 500
+    return user_directory.snapshot_response(snapshot)
 
-        # Construct the Admin API URL
-        # Docs: https://supabase.com/docs/reference/api/auth-admin-list-users
-        admin_url = f"{supabase_url}/auth/v1/admin/users"
-        
-        headers = {
-            "apikey": service_key,
-            "Authorization": f"Bearer {service_key}",
-            "Content-Type": "application/json"
-        }
-
-        users = []
-        page = 1
-        per_page = 50 # Default page size
-
-        while True:
-            print(f"Fetching page {page}...")
-            response = requests.get(
-                f"{admin_url}?page={page}&per_page={per_page}",
-                headers=headers
-            )
-
-            print(f"Supabase Response Status: {response.status_code}")
-            if response.status_code != 200:
-                print(f"Failed to fetch users: {response.text}")
-                return jsonify({"error": "Failed to fetch users from Supabase"}), 500
-
-            data = response.json()
-            users_page = data.get("users", [])
-            print(f"Users found in page: {len(users_page)}")
-            
-            if not users_page:
-                break
-                
-            users.extend(users_page)
-            page += 1
-
-        print(f"Total users fetched: {len(users)}")
-
-        # Format for frontend
-        formatted_users = []
-        for u in users:
-            uid = u.get("id")
-            email = u.get("email")
-            meta = u.get("user_metadata", {})
-            name = meta.get("full_name") or meta.get("name") or "Student"
-            
-            formatted_users.append({
-                "id": uid,
-                "email": email,
-                "name": name
-            })
-
-        return jsonify(formatted_users)
 
+@app.route('/users/search', methods=['GET'])
+def search_users():
+    """
+    Search users by name or email prefix/substring.
+    Query params: q, limit (default 20, max 100), cursor (from next_cursor).
+    Returns: { users: [{ id, email, name }], total, next_cursor }
+    """
+    try:
+        snapshot = user_directory.directory.get()
+    except upstream_limits.Overloaded:
+        raise
     except Exception as e:
-        print(f"Error in /get-users: {e}")
+        print(f"Error in /users/search: {e}")
         return jsonify({"error": str(e)}), 500
+    return user_directory.search_response(snapshot, request.args)
+
 
 
 if __name__ == '__main__':
+    # Local development: render queued videos inside this process too.
+    # Skip the reloader's parent process so jobs are not claimed twice.
+    if os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        import video_worker
+        video_worker.start_workers()
     app.run(debug=True)
\ No newline at end of file
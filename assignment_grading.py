@@ -0,0 +1,257 @@
+import base64
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from flask import jsonify
+from dotenv import load_dotenv
+
+import circuit_breaker
+import grading
+import llm_client
+import upstream_limits
+from cache import SingleFlight, TTLCache
+
+load_dotenv()
+
+GRADING_CONCURRENCY = int(os.getenv("GRADING_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("GRADING_BATCH_MAX_ITEMS", "200"))
+
+verdict_cache = TTLCache(
+    maxsize=int(os.getenv("VERDICT_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("VERDICT_CACHE_TTL", "86400"))
+)
+verdict_flight = SingleFlight()
+
+GRADING_PROMPT = (
+    "You are an expert teacher grading a student's answer.\n"
+    "Question: {question}\n"
+    "Student Answer: {user_answer}\n"
+    "Target Concept/Answer: {correct_answer}\n\n"
+    "Task:\n"
+    "1. Determine if the student's answer is essentially correct based on the target concept. "
+    "Be generous with phrasing but strict on facts.\n"
+    "2. Provide short, constructive feedback (max 2 sentences).\n\n"
+    "Output JSON ONLY:\n"
+    "{{ \"correct\": boolean, \"feedback\": \"string\" }}"
+)
+
+
+def verdict_cache_key(question_text, user_answer, correct_answer):
+    """Answers differing only in case, spacing or trailing punctuation share a verdict."""
+    return (
+        grading.normalize(question_text),
+        grading.normalize(correct_answer),
+        grading.normalize(user_answer),
+    )
+
+
+def _grade_with_llm(question_text, user_answer, correct_answer):
+    """Returns the {correct, feedback} verdict, or None if the LLM call failed."""
+    prompt = GRADING_PROMPT.format(
+        question=question_text, user_answer=user_answer, correct_answer=correct_answer
+    )
+    try:
+        content = llm_client.complete(prompt, site="grading", response_format={"type": "json_object"})
+        result = json.loads(content)
+        correct = result["correct"]
+        # bool("false") is True; anything but a real verdict counts as a failed call
+        if isinstance(correct, str) and correct.strip().lower() in ("true", "false"):
+            correct = correct.strip().lower() == "true"
+        if not isinstance(correct, bool):
+            raise ValueError(f"Unexpected verdict {correct!r}")
+        return {"correct": correct, "feedback": str(result.get("feedback", ""))}
+    except circuit_breaker.CircuitOpen as e:
+        # OpenRouter is failing fast: degrade to the simple check
+        print(f"Grading without the LLM: {e}")
+        return None
+    except upstream_limits.Overloaded:
+        raise
+    except Exception as e:
+        print(f"Error evaluating answer: {e}")
+        return None
+
+
+def grade_answer(question_text, user_answer, correct_answer, question_type=None, options=None):
+    """Grade one answer: locally when possible, otherwise with the LLM."""
+    # Deterministic answers (MC, T/F, numbers, algebra) never reach the LLM
+    local = grading.grade_locally(
+        question_text, user_answer, correct_answer,
+        question_type=question_type, options=options
+    )
+    if local is not None:
+        return dict(local, grader="local")
+
+    key = verdict_cache_key(question_text, user_answer, correct_answer)
+    cached = verdict_cache.get(key)
+    if cached is not None:
+        return dict(cached, grader="llm")
+    # Identical answers graded at the same time (a class batch) share one call
+    verdict = verdict_flight.do(
+        key, lambda: _grade_with_llm(question_text, user_answer, correct_answer)
+    )
+    if verdict is None:
+        # Fallback to simple containment check if AI fails
+        is_correct = correct_answer.lower() in user_answer.lower() if correct_answer else False
+        return {"correct": is_correct, "feedback": "AI evaluation failed, falling back to simple check.",
+                "grader": "fallback"}
+    verdict_cache.set(key, verdict)
+    return dict(verdict, grader="llm")
+
+
+def grade_item(item):
+    if not item.get('question') or not item.get('user_answer'):
+        return {"correct": False, "error": "Missing question or answer"}
+    try:
+        return grade_answer(
+            item['question'], item['user_answer'], item.get('correct_answer', ''),
+            question_type=item.get('type'), options=item.get('options')
+        )
+    except upstream_limits.Overloaded as e:
+        # One item waiting too long should not fail the rest of the batch
+        return upstream_limits.rejected_result(e, correct=False)
+
+
+def _bearer_token(authorization):
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[len("bearer "):].strip() or None
+    return None
+
+
+def jwt_subject(token):
+    """
+    The sub claim of a Supabase access token, read without verifying it.
+    Only used to reject obviously mismatched requests early; Supabase
+    verifies the token and RLS decides what may be written.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get("sub")
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
+def save_assignment_progress(rows, access_token):
+    """
+    Upsert score/answers rows into student_assignment_progress as the
+    calling user (their JWT with the anon key), so the table's RLS
+    policies apply.
+    """
+    supabase_url = os.getenv("SUPABASE_URL")
+    anon_key = os.getenv("SUPABASE_ANON_KEY") or os.getenv("SUPABASE_KEY")
+    if not supabase_url or not anon_key:
+        raise RuntimeError("Missing Supabase keys")
+
+    headers = {
+        "apikey": anon_key,
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+        "Prefer": "resolution=merge-duplicates,return=minimal"
+    }
+    url = f"{supabase_url}/rest/v1/student_assignment_progress?on_conflict=assignment_id,student_id"
+    with circuit_breaker.guard("supabase", "student_assignment_progress") as call:
+        response = requests.post(url, headers=headers, json=rows, timeout=30)
+        call.status = response.status_code
+    return response
+
+
+def evaluate_answer_response(data):
+    """Body and status for a single {question, user_answer, correct_answer[, type, options]}."""
+    question_text = data.get('question', '')
+    user_answer = data.get('user_answer', '')
+    correct_answer = data.get('correct_answer', '')  # Optional, if available
+
+    if not question_text or not user_answer:
+        return jsonify({"error": "Missing question or answer"}), 400
+
+    return jsonify(grade_answer(
+        question_text, user_answer, correct_answer,
+        question_type=data.get('type'), options=data.get('options')
+    )), 200
+
+
+def evaluate_answers_response(data, authorization=None):
+    """
+    Grade a list of {question, user_answer, correct_answer[, type, options,
+    student_id]} items. Items the local grader can decide are answered
+    directly; the rest are sent to the LLM concurrently. With assignment_id
+    set, the student's score and answers are upserted into
+    student_assignment_progress as the caller: the Authorization header
+    must carry their Supabase access token, and every item must belong
+    to them (RLS only lets students write their own progress). The body
+    reports "saved": the number of rows written, or false when grading or
+    the save did not complete.
+    """
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items per request"}), 400
+    if not all(isinstance(item, dict) for item in items):
+        return jsonify({"error": "Each item must be an object"}), 400
+
+    # Reject unsavable requests before spending any LLM calls on them
+    assignment_id = data.get('assignment_id')
+    access_token = None
+    if assignment_id:
+        access_token = _bearer_token(authorization)
+        if not access_token:
+            return jsonify({"error": "Sign in to save assignment progress"}), 401
+        student_ids = [item.get('student_id') or data.get('student_id') for item in items]
+        if not all(student_ids):
+            return jsonify({"error": "student_id is required to save progress"}), 400
+        subject = jwt_subject(access_token)
+        if subject is None or any(student_id != subject for student_id in student_ids):
+            return jsonify({"error": "You can only save your own progress"}), 403
+
+    workers = max(1, min(GRADING_CONCURRENCY, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(grade_item, items))
+    # 429 only when nothing in the batch could be graded
+    upstream_limits.raise_if_all_rejected(results)
+    retry_after = max((r["retry_after"] for r in results if "retry_after" in r), default=None)
+
+    body = {
+        "results": results,
+        "correct": sum(1 for r in results if r.get("correct")),
+        "total": len(results),
+    }
+    if retry_after is not None:
+        body["retry_after"] = retry_after
+    if not assignment_id:
+        return jsonify(body), 200
+    if retry_after is not None or any(r.get("grader") == "fallback" for r in results):
+        # Saving now would record rejected or guessed answers as the grade
+        return jsonify(dict(body, saved=False, error="Some answers could not be graded yet, please retry")), 200
+
+    answers = [{
+        "question": item.get('question'),
+        "user_answer": item.get('user_answer'),
+        "correct": bool(result.get("correct")),
+        "feedback": result.get("feedback"),
+    } for item, result in zip(items, results)]
+    rows = [{
+        "assignment_id": assignment_id,
+        "student_id": student_ids[0],
+        "status": "completed",
+        "score": round(100 * sum(a["correct"] for a in answers) / len(answers)),
+        "answers": answers,
+        "completed_at": datetime.now(timezone.utc).isoformat(),
+    }]
+
+    try:
+        response = save_assignment_progress(rows, access_token)
+    except Exception as e:
+        print(f"Error saving assignment progress: {e}")
+        return jsonify(dict(body, saved=False, error="Failed to save assignment progress")), 502
+    if response.status_code in (401, 403):
+        # Expired token, or RLS refused the write
+        return jsonify(dict(body, saved=False, error="Not allowed to save this progress")), 403
+    if response.status_code >= 300:
+        print(f"Supabase upsert failed ({response.status_code}): {response.text}")
+        return jsonify(dict(body, saved=False, error="Failed to save assignment progress")), 502
+    body["saved"] = len(rows)
+    return jsonify(body), 200
@@ -0,0 +1,290 @@
+"""
+Offline load test for the Flask backend.
+
+Starts local stubs for OpenRouter, Gemini and Supabase, points app.py at
+them, serves the app on a local port and drives each route at rising
+concurrency. Reports throughput, p50/p95/p99 latency and error rate.
+
+    python bench/run.py
+    python bench/run.py --routes chatbot,evaluate-answer --levels 1,8,32 --latency 300
+    python bench/run.py --save baseline.json
+    python bench/run.py --compare baseline.json      # exits 1 on a regression
+
+No network access or API keys are needed. Video routes are not covered
+(they need Manim and ffmpeg).
+"""
+import argparse
+import base64
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stubs import GeminiStub, OpenRouterStub, StubConfig, SupabaseStub, start_stub  # noqa: E402
+
+NOTES = "\n".join(
+    f"{topic}: " + " ".join(f"{topic.split()[0].lower()}-detail-{i}" for i in range(25))
+    for _ in range(12)
+    for topic in ("Photosynthesis light reactions", "Mitosis phases", "Newton second law", "Krebs cycle")
+)
+QUESTIONS = ["What happens in mitosis?", "Explain the light reactions.", "State Newton's second law.",
+             "Where does the Krebs cycle happen?"]
+
+
+def _png(seed):
+    """A tiny valid grayscale PNG whose pixels (and hash) depend on seed."""
+    rng = random.Random(seed)
+    width = height = 16
+    rows = b"".join(b"\x00" + bytes(rng.randrange(256) for _ in range(width)) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def _jwt(claims):
+    """An unsigned token shaped like a Supabase access token; the stub does not verify it."""
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+    return f"{part({'alg': 'HS256', 'typ': 'JWT'})}.{part(claims)}.stub"
+
+
+STUDENT_AUTH = {"Authorization": f"Bearer {_jwt({'sub': 's1', 'role': 'authenticated'})}"}
+
+
+def _uid():
+    return base64.b32encode(os.urandom(5)).decode().lower()
+
+
+# Each scenario returns (method, path, request kwargs). Random parts keep
+# the app's caches from turning the run into a cache benchmark; the
+# "-cached" variants measure the cache paths on purpose.
+SCENARIOS = {
+    "chatbot": lambda: ("POST", "/chatbot", {"json": {
+        "notes": NOTES, "user_message": f"{random.choice(QUESTIONS)} ({_uid()})"}}),
+    "chatbot-stream": lambda: ("POST", "/chatbot", {"stream": True, "json": {
+        "notes": NOTES, "user_message": random.choice(QUESTIONS), "stream": True}}),
+    "create-questions": lambda: ("POST", "/create-questions", {"json": {
+        "topic": f"cell biology {_uid()}", "count": 3}}),
+    "create-questions-cached": lambda: ("POST", "/create-questions", {"json": {
+        "topic": "cell biology", "count": 3}}),
+    "evaluate-answer": lambda: ("POST", "/evaluate-answer", {"json": {
+        "question": "What does osmosis move?", "user_answer": f"water molecules {_uid()}",
+        "correct_answer": "water"}}),
+    "evaluate-answer-local": lambda: ("POST", "/evaluate-answer", {"json": {
+        "question": "2x = 8, x = ?", "user_answer": str(random.choice([4, 4.0, 5])), "correct_answer": "4"}}),
+    "evaluate-answers": lambda: ("POST", "/evaluate-answers", {"headers": STUDENT_AUTH, "json": {"items": [
+        {"question": f"Q{i}", "user_answer": f"answer {_uid()}", "correct_answer": "answer"}
+        for i in range(10)
+    ], "assignment_id": "a1", "student_id": "s1"}}),
+    "extract-text": lambda: ("POST", "/extract-text", {"files": [
+        ("images", (f"page{i}.png", _png(_uid()), "image/png")) for i in range(2)
+    ]}),
+    "get-users": lambda: ("GET", "/get-users", {}),
+    "users-search": lambda: ("GET", "/users/search", {"params": {
+        "q": random.choice(["stud", "student1", "example", "12"]), "limit": 20}}),
+    "leave-class": lambda: ("POST", "/leave-class", {"json": {"student_id": "s1", "class_id": "c1"}}),
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _one_request(session, base_url, scenario, result_keys):
+    method, path, kwargs = SCENARIOS[scenario]()
+    stream = kwargs.pop("stream", False)
+    started = time.perf_counter()
+    try:
+        response = session.request(method, base_url + path, timeout=120, stream=stream, **kwargs)
+        if stream:
+            for _ in response.iter_content(chunk_size=None):
+                pass
+        ok = response.status_code < 400
+        if path == "/extract-text" and ok:
+            result_keys.append(response.json().get("result_key"))
+    except requests.RequestException:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def run_level(base_url, scenario, concurrency, total, result_keys):
+    sessions = threading.local()
+
+    def task(_):
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        return _one_request(sessions.session, base_url, scenario, result_keys)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(task, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        "route": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "error_rate": errors / total,
+    }
+
+
+def _configure_environment(args, workdir):
+    """Point every upstream at the stubs; must run before app is imported."""
+    llm = StubConfig(args.latency, failure_rate=args.failure_rate)
+    gemini = StubConfig(args.ocr_latency, failure_rate=args.failure_rate)
+    supabase = StubConfig(args.supabase_latency, failure_rate=args.failure_rate)
+    stubs = {
+        "openrouter": start_stub(OpenRouterStub, llm),
+        "gemini": start_stub(GeminiStub, gemini),
+        "supabase": start_stub(SupabaseStub, supabase, user_count=args.users),
+    }
+    os.environ.update({
+        "OPENROUTER_URL": stubs["openrouter"][1] + "/api/v1/chat/completions",
+        "MISTRAL_API_KEY": "bench",
+        "GEMINI_BASE_URL": stubs["gemini"][1],
+        "GOOGLE_API_KEY": "bench",
+        "SUPABASE_URL": stubs["supabase"][1],
+        "SUPABASE_SERVICE_ROLE_KEY": "bench",
+        "SUPABASE_KEY": "bench",
+        # Keep the benchmark's caches and job files out of the working tree
+        "OCR_CACHE_PATH": str(workdir / "ocr_cache.sqlite3"),
+        "RENDER_CACHE_DIR": str(workdir / "renders"),
+        "AUDIO_CACHE_DIR": str(workdir / "audio"),
+        "VIDEO_JOBS_DIR": str(workdir / "jobs"),
+    })
+    return stubs
+
+
+def _serve_app():
+    from werkzeug.serving import make_server
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as backend
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", backend
+
+
+def _print_header():
+    header = f"{'route':<24}{'conc':>5}{'req':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'err %':>7}"
+    print(header)
+    print("-" * len(header))
+
+
+def _print_row(r):
+    print(f"{r['route']:<24}{r['concurrency']:>5}{r['requests']:>6}{r['rps']:>9.1f}"
+          f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['error_rate'] * 100:>7.1f}", flush=True)
+
+
+def compare(rows, baseline_path, tolerance):
+    """Regressions against a saved run: slower p95 or more errors."""
+    baseline = {(r["route"], r["concurrency"]): r for r in json.loads(Path(baseline_path).read_text())}
+    regressions = []
+    for r in rows:
+        old = baseline.get((r["route"], r["concurrency"]))
+        if old is None:
+            continue
+        if r["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{r['route']} @{r['concurrency']}: p95 {old['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+        if r["error_rate"] > old["error_rate"] + 0.01:
+            regressions.append(f"{r['route']} @{r['concurrency']}: errors "
+                               f"{old['error_rate']:.1%} -> {r['error_rate']:.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", default=",".join(SCENARIOS), help="comma-separated scenario names")
+    parser.add_argument("--levels", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="requests per route and level")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests per route first")
+    parser.add_argument("--latency", type=float, default=200, help="OpenRouter stub latency (ms)")
+    parser.add_argument("--ocr-latency", type=float, default=400, help="Gemini stub latency (ms)")
+    parser.add_argument("--supabase-latency", type=float, default=30, help="Supabase stub latency (ms)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of stub calls that fail")
+    parser.add_argument("--users", type=int, default=2000, help="users in the Supabase stub")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON from --save; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown for --compare")
+    args = parser.parse_args()
+
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = [r for r in routes if r not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    levels = [int(level) for level in args.levels.split(",")]
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-"))
+    # app.py reads prompt files relative to the project root
+    os.chdir(ROOT)
+    stubs = _configure_environment(args, workdir)
+    server, base_url, backend = _serve_app()
+
+    rows = []
+    result_keys = []
+    _print_header()
+    try:
+        for route in routes:
+            # Cold starts (user directory load, first connections) are not the hot path
+            if args.warmup:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run_level(base_url, route, 1, args.warmup, result_keys)
+            for level in levels:
+                # The app's print() logging would drown the report
+                with contextlib.redirect_stdout(io.StringIO()):
+                    rows.append(run_level(base_url, route, level, args.requests, result_keys))
+                _print_row(rows[-1])
+    finally:
+        server.shutdown()
+        for key in result_keys:
+            if key:
+                Path(backend.RESULTS_FOLDER, f"{key}.txt").unlink(missing_ok=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print("Upstream calls: " + ", ".join(
+        f"{name} {sum(stub.counts.values())}" for name, (stub, _) in stubs.items()
+    ))
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(rows, indent=2))
+    if args.compare:
+        regressions = compare(rows, args.compare, args.tolerance)
+        for line in regressions:
+            print("REGRESSION " + line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
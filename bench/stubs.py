@@ -0,0 +1,191 @@
+"""
+Local stand-ins for the services the backend calls, for offline benchmarks.
+
+Each stub is a threaded HTTP server with its own latency and failure
+settings:
+    OpenRouterStub  POST /api/v1/chat/completions (JSON or SSE streaming)
+    GeminiStub      POST /v1beta/models/<model>:generateContent
+    SupabaseStub    GET  /auth/v1/admin/users, DELETE/POST /rest/v1/<table>
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubConfig:
+    """Latency is sampled uniformly from latency_ms +/- jitter_ms."""
+
+    def __init__(self, latency_ms=100, jitter_ms=None, failure_rate=0.0, failure_status=500):
+        self.latency_ms = latency_ms
+        self.jitter_ms = latency_ms / 2 if jitter_ms is None else jitter_ms
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+    counts = None
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _delay(self):
+        config = self.config
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        time.sleep(max(delay, 0) / 1000)
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        self.counts[method] = self.counts.get(method, 0) + 1
+        body = self._body()
+        self._delay()
+        if random.random() < self.config.failure_rate:
+            self._send_json(self.config.failure_status, {"error": {"message": "stub failure"}})
+            return
+        self.respond(method, urlparse(self.path), body)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def respond(self, method, url, body):
+        self._send_json(404, {"error": "not found"})
+
+
+def _question_set():
+    questions = [
+        {"type": "mcq", "question": "Which organelle makes ATP?",
+         "options": ["Nucleus", "Mitochondria", "Ribosome", "Golgi"], "answer": "Mitochondria"},
+        {"type": "boolean", "question": "Plants perform photosynthesis.", "answer": "True"},
+        {"type": "free", "question": "Define osmosis.", "answer": "Diffusion of water across a membrane"},
+    ]
+    return "```json\n" + json.dumps(questions) + "\n```"
+
+
+def _chat_reply(prompt, payload):
+    """Pick a reply shaped like what the calling route parses."""
+    if payload.get("response_format", {}).get("type") == "json_object":
+        return json.dumps({"correct": random.random() < 0.5, "feedback": "Stub feedback."})
+    if "ONLY ask the user" in prompt:
+        return _question_set()
+    if prompt.startswith("Summarize this study-chat"):
+        return "The student asked about cell biology and got short answers."
+    if "generate a viable TITLE" in prompt:
+        return "Stub Notes Title"
+    return "This is a stub answer with a formula $E = mc^2$ for the benchmark."
+
+
+class OpenRouterStub(_StubHandler):
+    # Delay between streamed tokens
+    token_interval_ms = 5
+
+    def respond(self, method, url, body):
+        if method != "POST" or not url.path.endswith("/chat/completions"):
+            return super().respond(method, url, body)
+        messages = body.get("messages") or [{}]
+        reply = _chat_reply(str(messages[-1].get("content", "")), body)
+        if not body.get("stream"):
+            self._send_json(200, {
+                "id": "stub", "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in re.findall(r"\S+\s*", reply):
+            chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(self.token_interval_ms / 1000)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class GeminiStub(_StubHandler):
+    def respond(self, method, url, body):
+        if method != "POST" or not url.path.endswith(":generateContent"):
+            return super().respond(method, url, body)
+        text = "# Stub notes\n- Photosynthesis converts light to chemical energy.\n- ATP is made in mitochondria.\n"
+        self._send_json(200, {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {"promptTokenCount": 300, "candidatesTokenCount": 40},
+        })
+
+
+class SupabaseStub(_StubHandler):
+    user_count = 2000
+
+    def respond(self, method, url, body):
+        if method == "GET" and url.path == "/auth/v1/admin/users":
+            query = parse_qs(url.query)
+            page = int(query.get("page", ["1"])[0])
+            per_page = int(query.get("per_page", ["50"])[0])
+            start = (page - 1) * per_page
+            users = [
+                {
+                    "id": f"00000000-0000-0000-0000-{i:012d}",
+                    "email": f"student{i}@example.edu",
+                    "user_metadata": {"full_name": f"Student {i} Example"},
+                }
+                for i in range(start, min(start + per_page, self.user_count))
+            ]
+            self._send_json(200, {"users": users, "aud": "authenticated"},
+                            {"X-Total-Count": str(self.user_count)})
+        elif url.path.startswith("/rest/v1/") and method == "DELETE":
+            self._send_json(200, [])
+        elif url.path.startswith("/rest/v1/") and method == "POST":
+            self._send_json(201, [])
+        else:
+            super().respond(method, url, body)
+
+
+def start_stub(handler, config=None, **attrs):
+    """
+    Serve handler on a free local port in a background thread.
+    Returns (server, base_url); server.counts holds requests per method.
+    """
+    counts = {}
+    handler_cls = type(handler.__name__, (handler,), dict(attrs, config=config or StubConfig(), counts=counts))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_cls)
+    server.daemon_threads = True
+    server.counts = counts
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
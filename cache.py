@@ -0,0 +1,265 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class SQLiteCache:
+    """
+    Persistent key/value cache stored in a single SQLite file.
+    Entries are evicted least-recently-used first once the stored values
+    exceed max_bytes. Hit/miss counters live in the same file so every
+    gunicorn worker reports the same totals.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _bump(self, conn, name):
+        conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1)"
+            " ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def _is_valid(self, value):
+        return True
+
+    def _on_evict(self, value):
+        pass
+
+    def get(self, key):
+        """Return the cached value or None, refreshing its LRU position."""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and not self._is_valid(row[0]):
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._bump(conn, "misses")
+            else:
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._bump(conn, "hits")
+            conn.commit()
+        return None if row is None else row[0]
+
+    def set(self, key, value, size=None):
+        """Store a str or bytes value, then evict down to the size cap."""
+        if size is None:
+            size = len(value.encode("utf-8") if isinstance(value, str) else value)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = conn.execute(
+                    "SELECT key, size, value FROM entries ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (oldest[0],))
+                self._on_evict(oldest[2])
+                self._bump(conn, "evictions")
+                total -= oldest[1]
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class FileCache(SQLiteCache):
+    """
+    Content-addressed files on disk (rendered videos, audio) with a byte
+    budget. The SQLite index tracks sizes and LRU order; evicting an entry
+    deletes its file.
+    """
+
+    def __init__(self, directory, max_bytes, suffix=""):
+        super().__init__(os.path.join(directory, "index.sqlite3"), max_bytes)
+        self.directory = directory
+        self.suffix = suffix
+
+    def path_for(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + self.suffix)
+
+    def _is_valid(self, value):
+        return os.path.exists(value)
+
+    def _on_evict(self, value):
+        try:
+            os.remove(value)
+        except FileNotFoundError:
+            pass
+
+    def put_file(self, key, src_path):
+        """Copy src_path into the cache under key and return the cached path."""
+        os.makedirs(self.directory, exist_ok=True)
+        dest = self.path_for(key)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src_path, tmp)
+        os.replace(tmp, dest)
+        self.set(key, dest, size=os.path.getsize(dest))
+        return dest
+
+    def get_file(self, key, dest_path):
+        """
+        Materialize a cached file at dest_path (hard link when possible).
+        Returns True on a hit, False on a miss.
+        """
+        cached = self.get(key)
+        if cached is None:
+            return False
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        try:
+            try:
+                os.link(cached, dest_path)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                shutil.copyfile(cached, dest_path)
+        except FileNotFoundError:
+            # Evicted by another process between the lookup and the link
+            return False
+        return True
+
+
+class TTLCache:
+    """In-process LRU cache whose entries also expire after ttl seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value or None if missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] < time.monotonic():
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._data),
+                "max_entries": self.maxsize,
+                "ttl_seconds": self.ttl,
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: the first caller runs the
+    function, everyone else arriving while it is in flight waits for and
+    shares its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+
+from dotenv import load_dotenv
+
+import llm_client
+from cache import TTLCache
+
+load_dotenv()
+
+# Upper bound on the tokens of prior conversation sent with each question
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+# When a new summary is needed, fold until the verbatim tail fits this share
+# of the budget, so the next few turns fit without summarizing again
+RECENT_SHARE = float(os.getenv("CHAT_HISTORY_RECENT_SHARE", "0.5"))
+MIN_RECENT_MESSAGES = int(os.getenv("CHAT_HISTORY_MIN_RECENT", "2"))
+SUMMARY_MAX_WORDS = 150
+
+# Per-message framing overhead on top of the content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Summarize this study-chat conversation between a student and a study assistant "
+    f"in at most {SUMMARY_MAX_WORDS} words. Keep the topics covered, facts and formulas "
+    "established, and any open questions. Write plain prose, no preamble.\n\n"
+)
+
+summary_cache = TTLCache(
+    maxsize=int(os.getenv("CHAT_SUMMARY_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("CHAT_SUMMARY_CACHE_TTL", "21600"))
+)
+
+
+def message_tokens(message):
+    return llm_client.estimate_tokens(str(message.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _prefix_hashes(messages):
+    """hashes[i] identifies messages[:i]; each extends the previous one."""
+    hashes = [hashlib.sha256(b"chat").hexdigest()]
+    for message in messages:
+        step = json.dumps([message.get("role"), message.get("content")]).encode("utf-8")
+        hashes.append(hashlib.sha256(hashes[-1].encode("ascii") + step).hexdigest())
+    return hashes
+
+
+def _summarize(previous_summary, messages):
+    """Fold messages into the running summary with one LLM call."""
+    transcript = "\n".join(f"{m.get('role', 'user')}: {m.get('content') or ''}" for m in messages)
+    if previous_summary:
+        transcript = f"Summary so far: {previous_summary}\n\n{transcript}"
+    return llm_client.complete(SUMMARY_PROMPT + transcript, site="summary").strip()
+
+
+def _summary_message(summary):
+    return {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+
+
+def compact(chat_history, budget=None):
+    """
+    Fit chat_history into the token budget.
+    Recent messages are kept verbatim and older ones are replaced by a
+    rolling summary. Summaries are cached by a hash of the messages they
+    cover, so later turns of the same conversation reuse them and only
+    fold in the messages that have aged out since.
+    Returns (messages, info).
+    """
+    budget = budget or HISTORY_TOKEN_BUDGET
+    chat_history = list(chat_history or [])
+    sizes = [message_tokens(m) for m in chat_history]
+    total = sum(sizes)
+    info = {"history_tokens": total, "sent_tokens": total, "summarized_messages": 0}
+    if total <= budget:
+        return chat_history, info
+
+    hashes = _prefix_hashes(chat_history)
+    # suffix[i] = tokens of chat_history[i:]
+    suffix = [0] * (len(chat_history) + 1)
+    for i in range(len(chat_history) - 1, -1, -1):
+        suffix[i] = suffix[i + 1] + sizes[i]
+    last_fold = max(len(chat_history) - MIN_RECENT_MESSAGES, 0)
+
+    # A summary from an earlier turn may still leave room for the tail
+    cached = {}
+    for i in range(last_fold, 0, -1):
+        summary = summary_cache.get(hashes[i])
+        if summary is not None:
+            cached[i] = summary
+            if suffix[i] + message_tokens(_summary_message(summary)) <= budget:
+                return _result(chat_history, i, summary, info, cached=True)
+            break
+
+    # Otherwise fold until the tail fits its share, building on the newest summary
+    fold = next(
+        (i for i in range(1, last_fold + 1) if suffix[i] <= budget * RECENT_SHARE),
+        last_fold
+    )
+    if fold == 0:
+        return chat_history, info
+    base = max((i for i in cached if i <= fold), default=0)
+    try:
+        summary = _summarize(cached.get(base), chat_history[base:fold])
+    except llm_client.LLMError as e:
+        print(f"Chat history summary failed, dropping older turns: {e}")
+        kept = chat_history[fold:]
+        info.update(sent_tokens=suffix[fold], summarized_messages=0, dropped_messages=fold)
+        return kept, info
+    summary_cache.set(hashes[fold], summary)
+    return _result(chat_history, fold, summary, info, cached=False)
+
+
+def _result(chat_history, fold, summary, info, cached):
+    messages = [_summary_message(summary)] + chat_history[fold:]
+    info.update(
+        sent_tokens=sum(message_tokens(m) for m in messages),
+        summarized_messages=fold,
+        summary_cached=cached,
+    )
+    return messages, info
@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+import metrics
+import upstream_limits
+
+load_dotenv()
+
+# Open when at least MIN_CALLS calls in the last WINDOW_SECONDS saw at
+# least FAILURE_RATE of them fail; stay open for OPEN_SECONDS, then let
+# HALF_OPEN_CALLS trial calls through to decide whether to close again
+FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+WINDOW_SECONDS = int(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Numeric values for the breaker_state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(upstream_limits.Overloaded):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    status_code = 503
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(upstream, retry_after, f"{upstream} is unavailable, retry after {retry_after:.1f}s")
+
+    def public_message(self):
+        return f"{self.upstream} is temporarily unavailable, please retry shortly"
+
+
+def is_failure(status=None, error=None):
+    """Whether an outcome says the upstream is unhealthy (not that the request was bad)."""
+    if error is not None:
+        status = getattr(error, "status_code", None) or getattr(error, "code", None)
+        if not isinstance(status, int):
+            # Connection errors, timeouts and the like
+            return True
+    return status is not None and status >= 500
+
+
+class CircuitBreaker:
+    """
+    Rolling error rate over per-second buckets, with the usual
+    closed -> open -> half-open -> closed cycle.
+    """
+
+    def __init__(self, name, failure_rate=None, min_calls=None, window=None, open_seconds=None,
+                 half_open_calls=None):
+        self.name = name
+        self.failure_rate = FAILURE_RATE if failure_rate is None else failure_rate
+        self.min_calls = MIN_CALLS if min_calls is None else min_calls
+        self.window = WINDOW_SECONDS if window is None else window
+        self.open_seconds = OPEN_SECONDS if open_seconds is None else open_seconds
+        self.half_open_calls = HALF_OPEN_CALLS if half_open_calls is None else half_open_calls
+        self.state = CLOSED
+        self.opened_at = None
+        self.trips = 0
+        self.rejected = 0
+        self._buckets = deque()
+        self._probes = 0
+        self._lock = threading.Lock()
+        metrics.breaker_state.set(STATE_VALUES[CLOSED], upstream=name)
+
+    def _set_state(self, state):
+        if state != self.state:
+            print(f"Circuit breaker for {self.name}: {self.state} -> {state}")
+            self.state = state
+            metrics.breaker_state.set(STATE_VALUES[state], upstream=self.name)
+
+    def _trim(self, now):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+    def _counts(self):
+        calls = sum(bucket[1] for bucket in self._buckets)
+        failures = sum(bucket[2] for bucket in self._buckets)
+        return calls, failures
+
+    def _trip(self, now):
+        self._set_state(OPEN)
+        self.opened_at = now
+        self.trips += 1
+        self._probes = 0
+
+    def _cool_down(self, now):
+        if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+
+    def allow(self):
+        """Admit one call or raise CircuitOpen. Every admitted call must be followed by record()."""
+        with self._lock:
+            now = time.monotonic()
+            self._cool_down(now)
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return
+            self.rejected += 1
+            retry_after = self.open_seconds - (now - self.opened_at) if self.state == OPEN else 1.0
+        metrics.breaker_rejected.inc(upstream=self.name)
+        raise CircuitOpen(self.name, max(retry_after, 0.0))
+
+    def record(self, failed):
+        """
+        Outcome of an admitted call: True or False, or None when it never
+        reached the upstream (e.g. the limiter turned it away).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if failed:
+                    self._trip(now)
+                elif failed is not None:
+                    self._set_state(CLOSED)
+                    self._buckets.clear()
+                return
+            if failed is None or self.state != CLOSED:
+                return
+
+            second = int(now)
+            if self._buckets and self._buckets[-1][0] == second:
+                bucket = self._buckets[-1]
+            else:
+                bucket = [second, 0, 0]
+                self._buckets.append(bucket)
+            bucket[1] += 1
+            bucket[2] += 1 if failed else 0
+            self._trim(now)
+
+            calls, failures = self._counts()
+            if calls >= self.min_calls and failures / calls >= self.failure_rate:
+                print(f"{self.name}: {failures}/{calls} calls failed in the last {self.window}s")
+                self._trip(now)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self._cool_down(now)
+            self._trim(now)
+            calls, failures = self._counts()
+            retry_after = None
+            if self.state == OPEN:
+                retry_after = self.open_seconds - (now - self.opened_at)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "failures": failures,
+                "error_rate": failures / calls if calls else 0.0,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "retry_after": retry_after,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get(name):
+    """The process-wide breaker for an upstream."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+@contextmanager
+def guard(upstream, operation):
+    """
+    Everything around one call to an external service: the breaker check,
+    a limiter slot and the metrics timer. Yields the metrics handle; set
+    .status so 5xx answers count against the upstream.
+    """
+    breaker = get(upstream)
+    breaker.allow()
+    failed = None
+    try:
+        with upstream_limits.limit(upstream), metrics.track(upstream, operation) as call:
+            try:
+                yield call
+            except Exception as e:
+                failed = is_failure(error=e)
+                raise
+            failed = is_failure(status=call.status)
+    finally:
+        breaker.record(failed)
+
+
+def stats():
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+
+def health():
+    """Breaker and limiter state per upstream; "degraded" while any breaker is not closed."""
+    names = sorted(set(upstream_limits.DEFAULT_LIMITS) | set(_breakers))
+    upstreams = {
+        name: dict(upstream_limits.get(name).stats(), breaker=get(name).stats())
+        for name in names
+    }
+    degraded = any(u["breaker"]["state"] != CLOSED for u in upstreams.values())
+    return {"status": "degraded" if degraded else "ok", "upstreams": upstreams}
@@ -0,0 +1,329 @@
+import ast
+import math
+import operator
+import random
+import re
+
+# Numbers closer than this (relative, or absolute near zero) count as equal,
+# on top of the rounding implied by the decimals a student wrote
+REL_TOL = 1e-4
+ABS_TOL = 1e-9
+# Random points used to test two expressions for algebraic equivalence
+EQUIVALENCE_SAMPLES = 6
+# Longer answers are prose; leave them to the LLM
+MAX_EXPRESSION_CHARS = 200
+
+MC_TYPES = {"mcq", "multiple-choice", "multiple choice", "mc"}
+TF_TYPES = {"boolean", "true-false", "true/false", "tf"}
+
+# Synonyms are only trusted for true/false questions; elsewhere "right",
+# "n" or "f" may be the actual answer (a direction, a variable, a function)
+_TRUE = {"true", "t", "yes", "y", "correct", "right"}
+_FALSE = {"false", "f", "no", "n", "incorrect", "wrong"}
+
+# Units recognised even when written straight after the number ("12cm").
+# Other words only count as units after a space ("12 furlongs"), and
+# single letters only when they are known units written after a space.
+UNITS = {
+    "%", "°", "°c", "°f", "deg", "degrees", "rad", "k",
+    "mm", "cm", "m", "km", "in", "ft", "mi", "mg", "g", "kg", "lb", "lbs",
+    "ms", "s", "sec", "min", "h", "hr", "hrs", "ml", "l", "n", "kn", "j", "kj", "cal", "kcal",
+    "w", "kw", "v", "a", "ma", "hz", "khz", "pa", "kpa", "atm", "mol", "ev",
+    "m/s", "m/s^2", "m/s2", "km/h", "kph", "mph", "cm^2", "m^2", "cm^3", "m^3", "g/ml", "kg/m^3", "mol/l",
+}
+
+_OPTION_LABEL = re.compile(r"^\(?([a-h])[\).:]\s*(.*)$|^([a-h])$", re.IGNORECASE)
+_NUMBER = re.compile(r"^[-+]?(\d+(\.\d*)?|\.\d+)(e[-+]?\d+)?$", re.IGNORECASE)
+_UNIT_SUFFIX = re.compile(r"^(.*?\d)(\s*)([a-z°%][a-z°%]*(?:\^?[23])?(?:/[a-z]+(?:\^?[23])?)?)$", re.IGNORECASE)
+_EXPONENT = re.compile(r"^e[-+]?\d+$", re.IGNORECASE)
+_THOUSANDS = re.compile(r"^[-+]?\d{1,3}(,\d{3})+(\.\d*)?$")
+# "3 x 10^8", "3×10^8", "3*10**8"
+_TIMES_TEN = re.compile(r"^(.+?)\s*(?:x|×|\*|\\times|\\cdot)\s*10\s*(?:\^|\*\*)\s*\(?([-+]?\d+)\)?$")
+_DECIMALS = re.compile(r"\.(\d+)")
+_POWER = re.compile(r"(?:\de|10\s*(?:\^|\*\*)\s*\(?)([-+]?\d+)", re.IGNORECASE)
+_ASSIGNMENT = re.compile(r"^[a-z]\w*\s*=\s*(?!.*=)", re.IGNORECASE)
+
+_BINOPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+_UNARY = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+_FUNCS = {
+    "sqrt": math.sqrt, "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "ln": math.log, "log": math.log10, "exp": math.exp, "abs": abs,
+}
+_CONSTS = {"pi": math.pi, "e": math.e}
+
+
+def normalize(text):
+    """Lowercase, collapse whitespace and drop wrapping punctuation and $...$."""
+    text = str(text).strip().lower().replace("$", "")
+    text = " ".join(text.split())
+    return text.strip(" .;,!")
+
+
+def _verdict(correct, correct_answer):
+    if correct:
+        return {"correct": True, "feedback": "Correct!"}
+    return {"correct": False, "feedback": f"Not quite. The correct answer is {correct_answer}."}
+
+
+def _as_bool(text):
+    text = normalize(text)
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    return None
+
+
+def _option_index(answer, options):
+    """Resolve a letter ("B", "b)") or option text to an option index."""
+    text = normalize(answer)
+    match = _OPTION_LABEL.match(text)
+    letter = (match.group(1) or match.group(3)) if match else None
+    if options:
+        normalized_options = [normalize(o) for o in options]
+        if text in normalized_options:
+            return normalized_options.index(text)
+        if match and match.group(2) and normalize(match.group(2)) in normalized_options:
+            return normalized_options.index(normalize(match.group(2)))
+        if letter and ord(letter) - ord("a") < len(options):
+            return ord(letter) - ord("a")
+        return None
+    return ord(letter) - ord("a") if letter else None
+
+
+def _latex_to_expr(text):
+    """Rewrite the handful of LaTeX constructs students and the LLM use."""
+    text = text.replace("\\left", "").replace("\\right", "")
+    text = text.replace("\\cdot", "*").replace("\\times", "*").replace("\\div", "/")
+    text = re.sub(r"\\d?frac\{([^{}]*)\}\{([^{}]*)\}", r"((\1)/(\2))", text)
+    text = re.sub(r"\\sqrt\{([^{}]*)\}", r"sqrt(\1)", text)
+    text = re.sub(r"\\(pi|sin|cos|tan|ln|log|exp)", r"\1", text)
+    return text.replace("{", "(").replace("}", ")")
+
+
+def _strip_units(text):
+    """
+    Split "12.5 cm" into ("12.5", "cm"); unit is "" when there is none.
+    "2x" and "-2.5e3" keep their letters: a variable or an exponent is not a unit.
+    """
+    match = _UNIT_SUFFIX.match(text)
+    if not match:
+        return text, ""
+    number, space, unit = match.groups()
+    if _EXPONENT.match(unit):
+        return text, ""
+    if len(unit) == 1 and unit not in "%°":
+        # "5 m" is five metres, but "5m" or "2n" may just as well be 5*m
+        return (number, unit) if space and unit in UNITS else (text, "")
+    if unit in UNITS or space:
+        return number, unit
+    return text, ""
+
+
+def _parse_plain(text):
+    """A single number: "1,200", "-2.5e3", "3/4" or "3 x 10^8"; None otherwise."""
+    if _THOUSANDS.match(text):
+        text = text.replace(",", "")
+    if _NUMBER.match(text):
+        return float(text)
+    match = _TIMES_TEN.match(text)
+    if match:
+        mantissa = _parse_plain(match.group(1))
+        return None if mantissa is None else mantissa * 10.0 ** int(match.group(2))
+    if text.count("/") == 1:
+        num, den = (part.strip() for part in text.split("/"))
+        if _NUMBER.match(num) and _NUMBER.match(den) and float(den) != 0:
+            return float(num) / float(den)
+    # Lists ("2, 3"), mixed numbers ("1 1/2") and the like go to the LLM
+    return None
+
+
+def parse_number(text):
+    """
+    Parse "1,200", "3/4", "-2.5e3", "3 x 10^8", "45%" or "x = 7 m" into
+    (value, unit). Percentages keep their unit: (45.0, "%").
+    """
+    text = _ASSIGNMENT.sub("", normalize(text))
+    value = _parse_plain(text)
+    if value is not None:
+        return value, ""
+    text, unit = _strip_units(text)
+    value = _parse_plain(text)
+    if value is None or not unit:
+        return None
+    return value, unit
+
+
+def rounding_tolerance(text):
+    """
+    Half a unit in the last decimal place written: 0.005 for "0.33",
+    50 for "2.5e3", and 0 for whole numbers and fractions.
+    """
+    text = normalize(text)
+    decimals = _DECIMALS.search(text)
+    if not decimals:
+        return 0.0
+    power = _POWER.search(text)
+    shift = int(power.group(1)) if power else 0
+    return 0.5 * 10.0 ** (shift - len(decimals.group(1)))
+
+
+def _readings(value, unit, tolerance, other_unit):
+    """
+    (value, tolerance) pairs a number may stand for. Against a plain
+    number "45%" is read both as 0.45 and as 45.
+    """
+    readings = [(value, tolerance)]
+    if unit == "%" and other_unit != "%":
+        readings.append((value * 0.01, tolerance * 0.01))
+    return readings
+
+
+def _eval_node(node, env):
+    if isinstance(node, ast.Expression):
+        return _eval_node(node.body, env)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        # Floats overflow quickly instead of building huge ints (9**9**9)
+        return float(node.value)
+    if isinstance(node, ast.Name):
+        if node.id in env:
+            return env[node.id]
+        if node.id in _CONSTS:
+            return _CONSTS[node.id]
+        raise ValueError(f"Unknown name {node.id}")
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+        return _BINOPS[type(node.op)](_eval_node(node.left, env), _eval_node(node.right, env))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        return _UNARY[type(node.op)](_eval_node(node.operand, env))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in _FUNCS and len(node.args) == 1 and not node.keywords):
+        return _FUNCS[node.func.id](_eval_node(node.args[0], env))
+    raise ValueError("Unsupported expression")
+
+
+def parse_expression(text):
+    """
+    Parse a single-letter-variable algebraic expression such as "2x^2 + 3"
+    or "\\frac{x}{2}". Returns (ast, variables) or None if it is not one.
+    """
+    text = _ASSIGNMENT.sub("", normalize(text))
+    text = _latex_to_expr(text).replace("^", "**").replace(" ", "")
+    if not text or len(text) > MAX_EXPRESSION_CHARS or re.search(r"[^0-9a-z.+\-*/()]", text):
+        return None
+    # Words ("the answer is x") are prose, not products of variables
+    if any(w not in _FUNCS and w not in _CONSTS for w in re.findall(r"[a-z]{2,}", text)):
+        return None
+    # Keep known function/constant names whole, split everything else into
+    # single-letter variables, then add the implied multiplication signs
+    tokens = re.findall(r"sqrt|sin|cos|tan|ln|log|exp|abs|pi|\d+\.?\d*|\.\d+|[a-z]|\*\*|[+\-*/()]", text)
+    if "".join(tokens) != text:
+        return None
+    out = []
+    for token in tokens:
+        if out:
+            prev = out[-1]
+            prev_is_value = prev[-1].isalnum() or prev == ")" or prev[-1] == "."
+            starts_value = token[0].isalnum() or token[0] in "(."
+            if prev_is_value and starts_value and prev not in _FUNCS:
+                out.append("*")
+        out.append(token)
+    try:
+        tree = ast.parse("".join(out), mode="eval")
+    except SyntaxError:
+        return None
+    variables = sorted({
+        n.id for n in ast.walk(tree)
+        if isinstance(n, ast.Name) and n.id not in _FUNCS and n.id not in _CONSTS
+    })
+    return tree, variables
+
+
+def _close(a, b, tolerance=0.0):
+    return math.isclose(a, b, rel_tol=REL_TOL, abs_tol=max(ABS_TOL, tolerance))
+
+
+def expressions_equivalent(expected, given):
+    """
+    Compare two parsed expressions by evaluating both at random points.
+    Returns True/False, or None when they cannot be evaluated reliably.
+    """
+    expected_tree, expected_vars = expected
+    given_tree, given_vars = given
+    if set(given_vars) - set(expected_vars):
+        return False
+    rng = random.Random(0)
+    checked = 0
+    for _ in range(EQUIVALENCE_SAMPLES * 3):
+        env = {v: rng.uniform(0.5, 3.0) for v in expected_vars}
+        try:
+            a = _eval_node(expected_tree, env)
+            b = _eval_node(given_tree, env)
+        except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+            continue
+        if isinstance(a, complex) or isinstance(b, complex):
+            continue
+        if not _close(a, b):
+            return False
+        checked += 1
+        if checked >= EQUIVALENCE_SAMPLES:
+            return True
+    return None
+
+
+def grade_locally(question, user_answer, correct_answer, question_type=None, options=None):
+    """
+    Grade an answer without the LLM when that can be done deterministically:
+    multiple-choice option matching, true/false, numbers (with tolerance and
+    unit stripping) and simple algebraic equivalence.
+    Returns {"correct", "feedback"} or None when the LLM is needed.
+    """
+    if not correct_answer or not user_answer:
+        return None
+    question_type = normalize(question_type or "")
+
+    if normalize(user_answer) == normalize(correct_answer):
+        return _verdict(True, correct_answer)
+
+    if question_type in TF_TYPES or normalize(correct_answer) in ("true", "false"):
+        expected_bool = _as_bool(correct_answer)
+        given_bool = _as_bool(user_answer)
+        if expected_bool is not None and given_bool is not None:
+            return _verdict(expected_bool == given_bool, correct_answer)
+
+    if question_type in MC_TYPES or options:
+        expected_index = _option_index(correct_answer, options)
+        given_index = _option_index(user_answer, options)
+        if expected_index is not None and given_index is not None:
+            return _verdict(expected_index == given_index, correct_answer)
+
+    expected_number = parse_number(correct_answer)
+    given_number = parse_number(user_answer)
+    if expected_number is not None and given_number is not None:
+        (expected_value, expected_unit), (given_value, given_unit) = expected_number, given_number
+        # A missing unit is accepted; a different unit needs a human/LLM eye
+        if given_unit and expected_unit and given_unit != expected_unit:
+            return None
+        expected_readings = _readings(expected_value, expected_unit, rounding_tolerance(correct_answer), given_unit)
+        given_readings = _readings(given_value, given_unit, rounding_tolerance(user_answer), expected_unit)
+        # "3.14" for pi is right to the precision the student gave
+        if any(_close(e, g, tolerance) for e, _ in expected_readings for g, tolerance in given_readings):
+            return _verdict(True, correct_answer)
+        # Right only to the key's rounding ("9.81" for "9.8"): let the LLM judge
+        if any(_close(e, g, tolerance) for e, tolerance in expected_readings for g, _ in given_readings):
+            return None
+        return _verdict(False, correct_answer)
+
+    expected_expr = parse_expression(correct_answer)
+    given_expr = parse_expression(user_answer)
+    if expected_expr is not None and given_expr is not None and expected_expr[1]:
+        equivalent = expressions_equivalent(expected_expr, given_expr)
+        if equivalent is not None:
+            return _verdict(equivalent, correct_answer)
+
+    return None
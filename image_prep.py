@@ -0,0 +1,144 @@
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Pillow (and its HEIC/PDF helpers) are optional: without them uploads are
+# sent to Gemini as they are, which it also accepts
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pillow_heif = None
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+load_dotenv()
+
+# Long side of the image sent to OCR; phone photos are often 4000px+
+MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", "2048"))
+JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+GRAYSCALE = os.getenv("OCR_GRAYSCALE", "false").lower() in ("1", "true", "yes")
+PDF_DPI = int(os.getenv("OCR_PDF_DPI", "200"))
+PREP_WORKERS = int(os.getenv("OCR_PREP_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".heic": "image/heic",
+    ".heif": "image/heif",
+    ".pdf": "application/pdf",
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def mime_type_for(filename):
+    """Accepted upload type for filename, or None if it is not supported."""
+    return MIME_TYPES.get(Path(filename).suffix.lower())
+
+
+def _encode(image, filename):
+    """Orient, downscale, optionally grayscale and recompress one image."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        # Flatten transparency onto white so dark ink stays readable
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    if GRAYSCALE:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return {"filename": filename, "mime_type": "image/jpeg", "data": buffer.getvalue()}
+
+
+def _pdf_pages(filename, data):
+    pdf = pypdfium2.PdfDocument(data)
+    try:
+        pages = []
+        for number in range(len(pdf)):
+            bitmap = pdf[number].render(scale=PDF_DPI / 72)
+            pages.append(_encode(bitmap.to_pil(), f"{filename}#page={number + 1}"))
+        return pages
+    finally:
+        pdf.close()
+
+
+def prepare_upload(filename, mime_type, data):
+    """
+    Turn one upload into the list of page images to OCR.
+    Runs in a worker process. PDFs become one image per page; anything
+    that cannot be processed here is passed through unchanged.
+    """
+    original = {"filename": filename, "mime_type": mime_type, "data": data}
+    if Image is None:
+        return [original]
+    if mime_type == "application/pdf":
+        return _pdf_pages(filename, data) if pypdfium2 is not None else [original]
+    if mime_type in ("image/heic", "image/heif") and pillow_heif is None:
+        return [original]
+
+    with Image.open(io.BytesIO(data)) as image:
+        page = _encode(image, filename)
+    # Already-small JPEGs can grow when re-encoded; keep whichever is smaller
+    if mime_type == "image/jpeg" and len(page["data"]) >= len(data) and not GRAYSCALE:
+        return [original]
+    return [page]
+
+
+def get_pool():
+    """Shared process pool; image decoding and resizing are CPU-bound."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=PREP_WORKERS)
+    return _pool
+
+
+def iter_pages(uploads):
+    """
+    Preprocess uploads in the process pool and yield pages in upload order
+    as soon as each one is ready, so OCR can start on the first pages while
+    later ones are still being converted. Pages keep their upload's
+    "source" tag, if it has one.
+    """
+    if Image is None:
+        yield from uploads
+        return
+
+    pool = get_pool()
+    futures = [
+        (u, pool.submit(prepare_upload, u["filename"], u["mime_type"], u["data"]))
+        for u in uploads
+    ]
+    for upload, future in futures:
+        try:
+            pages = future.result()
+        except Exception as e:
+            print(f"Preprocessing failed for {upload['filename']}, sending original: {e}")
+            pages = [upload]
+        for page in pages:
+            if "source" in upload:
+                page["source"] = upload["source"]
+            print(f"Prepared {page['filename']} ({len(page['data'])} bytes)")
+            yield page
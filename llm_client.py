@@ -0,0 +1,461 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+import circuit_breaker
+import metrics
+import upstream_limits
+
+load_dotenv()
+
+# Single place to point every route at OpenRouter and pick the model.
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+DEFAULT_MODEL = os.getenv("OPENROUTER_MODEL", "mistralai/devstral-2512:free")
+
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "90"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "8"))
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+# Wall-clock budget for one call, retries and fallbacks included. Keep it
+# under gunicorn's --timeout (120s) so a slow model fails the request
+# cleanly instead of getting the worker killed.
+CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "100"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Models tried after the primary, for every call site without its own
+# LLM_MODELS_<SITE> chain (e.g. LLM_MODELS_GRADING=model-a,model-b)
+FALLBACK_MODELS = [m.strip() for m in os.getenv("OPENROUTER_FALLBACK_MODELS", "").split(",") if m.strip()]
+
+# A hedged request goes to the next model once the current one has been
+# slower than this percentile of its recent latencies at the call site
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_SECONDS", "10"))
+HEDGE_MIN_SECONDS = float(os.getenv("LLM_HEDGE_MIN_SECONDS", "1"))
+HEDGE_MAX_SECONDS = float(os.getenv("LLM_HEDGE_MAX_SECONDS", "30"))
+HEDGE_POOL_SIZE = int(os.getenv("LLM_HEDGE_POOL_SIZE", "32"))
+
+_session = None
+_session_lock = threading.Lock()
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """Raised when OpenRouter fails or returns an unusable response."""
+
+    def __init__(self, message, status_code=None, payload=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.payload = payload
+
+
+def get_session():
+    """Return the process-wide keep-alive session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English)."""
+    return (len(text) + 3) // 4
+
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {os.getenv('MISTRAL_API_KEY')}",
+        "Content-Type": "application/json",
+    }
+
+
+def _backoff(attempt, retry_after=None):
+    """Exponential backoff with full jitter, honouring Retry-After when sane."""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_CAP)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def new_deadline():
+    return time.monotonic() + CALL_DEADLINE
+
+
+def _remaining(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise LLMError(f"OpenRouter call ran past its {CALL_DEADLINE:.0f}s deadline")
+    return remaining
+
+
+def post_chat(payload, timeout=None, retries=None, stream=False, deadline=None):
+    """
+    POST a chat-completions payload with bounded retries.
+    Returns the final requests.Response (which may still be non-200).
+    Connection failures and retryable statuses are retried; read timeouts
+    are not (the model was already too slow once). Nothing runs past
+    deadline (a time.monotonic() value, CALL_DEADLINE from now by default).
+    """
+    connect_timeout, read_timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    retries = MAX_RETRIES if retries is None else retries
+    deadline = deadline or new_deadline()
+    session = get_session()
+
+    attempt = 0
+    while True:
+        remaining = _remaining(deadline)
+        try:
+            # A streamed body is read after the slot is released
+            with circuit_breaker.guard("openrouter", "chat_completions") as call:
+                response = session.post(
+                    OPENROUTER_URL,
+                    headers=_headers(),
+                    data=json.dumps(payload),
+                    timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)),
+                    stream=stream,
+                )
+                call.status = response.status_code
+        except requests.ReadTimeout as e:
+            raise LLMError(f"OpenRouter timed out: {e}") from e
+        except (requests.ConnectionError, requests.Timeout) as e:
+            delay = _backoff(attempt)
+            if attempt >= retries or time.monotonic() + delay >= deadline:
+                raise LLMError(f"OpenRouter request failed: {e}") from e
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            delay = _backoff(attempt, response.headers.get("Retry-After"))
+            if time.monotonic() + delay >= deadline:
+                return response
+            if response.status_code == 429:
+                # Rate limited upstream: hold back every caller, not just this one
+                upstream_limits.get("openrouter").bucket.pause(delay)
+            response.close()
+
+        print(f"OpenRouter call failed, retrying in {delay:.2f}s (attempt {attempt + 1}/{retries})")
+        time.sleep(delay)
+        attempt += 1
+
+
+def _chat_completion_once(messages, model, timeout, retries, extra, deadline=None):
+    payload = {"model": model, "messages": messages}
+    payload.update(extra)
+
+    response = post_chat(payload, timeout=timeout, retries=retries, deadline=deadline)
+    try:
+        data = response.json()
+    except ValueError:
+        raise LLMError("OpenRouter returned a non-JSON response", response.status_code, response.text)
+
+    if response.status_code != 200 or "error" in data:
+        raise LLMError(f"API Error: {data.get('error', data)}", response.status_code, data)
+    if not data.get("choices"):
+        raise LLMError(f"Unexpected API response format: {data}", response.status_code, data)
+    return data
+
+
+def model_chain(site):
+    """Models to try for a call site, primary first."""
+    configured = os.getenv(f"LLM_MODELS_{site.upper()}", "")
+    chain = [m.strip() for m in configured.split(",") if m.strip()]
+    if not chain:
+        chain = [DEFAULT_MODEL] + FALLBACK_MODELS
+    # Keep order, drop repeats
+    return list(dict.fromkeys(chain))
+
+
+class LatencyWindow:
+    """Recent successful call latencies per (site, model)."""
+
+    def __init__(self, size=HEDGE_WINDOW):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, site, model, seconds):
+        with self._lock:
+            samples = self._samples.get((site, model))
+            if samples is None:
+                samples = self._samples[(site, model)] = deque(maxlen=self.size)
+            samples.append(seconds)
+
+    def percentile(self, site, model, pct):
+        with self._lock:
+            samples = sorted(self._samples.get((site, model), ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, max(0, math.ceil(pct / 100 * len(samples)) - 1))]
+
+    def hedge_delay(self, site, model):
+        """How long to wait on model before hedging to the next one."""
+        observed = self.percentile(site, model, HEDGE_PERCENTILE)
+        if observed is None:
+            return HEDGE_DEFAULT_SECONDS
+        return min(HEDGE_MAX_SECONDS, max(HEDGE_MIN_SECONDS, observed))
+
+
+latencies = LatencyWindow()
+
+
+class HedgeStats:
+    """Per call site: calls, hedges sent, fallbacks after errors, wins per model."""
+
+    def __init__(self):
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def _site(self, site):
+        entry = self._sites.get(site)
+        if entry is None:
+            entry = self._sites[site] = {"calls": 0, "hedged": 0, "fallbacks": 0, "wins": {}}
+        return entry
+
+    def record(self, site, hedged, fallbacks, winner):
+        with self._lock:
+            entry = self._site(site)
+            entry["calls"] += 1
+            entry["hedged"] += 1 if hedged else 0
+            entry["fallbacks"] += fallbacks
+            if winner is not None:
+                entry["wins"][winner] = entry["wins"].get(winner, 0) + 1
+            rate = entry["hedged"] / entry["calls"]
+        metrics.llm_calls.inc(site=site)
+        if hedged:
+            metrics.llm_hedged.inc(site=site)
+        if fallbacks:
+            metrics.llm_fallbacks.inc(fallbacks, site=site)
+        if winner is not None:
+            metrics.llm_wins.inc(site=site, model=winner)
+        metrics.llm_hedge_ratio.set(rate, site=site)
+
+    def stats(self):
+        with self._lock:
+            return {
+                site: dict(entry, wins=dict(entry["wins"]),
+                           hedge_rate=entry["hedged"] / entry["calls"] if entry["calls"] else 0.0)
+                for site, entry in self._sites.items()
+            }
+
+
+hedge_stats = HedgeStats()
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix="llm-hedge")
+    return _hedge_pool
+
+
+def _timed_attempt(site, model, messages, timeout, retries, extra, deadline):
+    started = time.perf_counter()
+    data = _chat_completion_once(messages, model, timeout, retries, extra, deadline)
+    if not (data["choices"][0].get("message") or {}).get("content"):
+        raise LLMError(f"{model} returned an empty answer", 200, data)
+    latencies.record(site, model, time.perf_counter() - started)
+    return data
+
+
+def _hedged_completion(site, chain, messages, timeout, retries, extra):
+    """
+    Ask chain[0]; if it has not answered within its hedge delay, also ask
+    the next model, and so on. A failed attempt moves on to the next model
+    straight away. The first good answer wins; slower attempts still finish
+    in the background (an in-flight HTTP call cannot be withdrawn) and
+    their answers are dropped.
+    """
+    pool = _get_hedge_pool()
+    # One budget for the whole chain, hedges included
+    deadline = new_deadline()
+    pending = {}
+    errors = []
+    launched = []
+    hedged = False
+
+    def launch():
+        model = chain[len(launched)]
+        launched.append(model)
+        # Only the last model in the chain is worth retrying; the others
+        # have somewhere to fall back to
+        attempt_retries = retries if len(launched) == len(chain) else 0
+        future = pool.submit(_timed_attempt, site, model, messages, timeout, attempt_retries, extra, deadline)
+        pending[future] = model
+
+    launch()
+    while pending:
+        can_hedge = len(launched) < len(chain)
+        delay = latencies.hedge_delay(site, launched[-1]) if can_hedge else None
+        done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+        if not done:
+            print(f"{launched[-1]} slower than {delay:.1f}s for {site}, hedging to {chain[len(launched)]}")
+            hedged = True
+            launch()
+            continue
+        for future in done:
+            model = pending.pop(future)
+            try:
+                data = future.result()
+            except (LLMError, upstream_limits.Overloaded) as e:
+                print(f"{model} failed for {site}: {e}")
+                errors.append(e)
+                if len(launched) < len(chain):
+                    launch()
+                continue
+            hedge_stats.record(site, hedged, len(errors), model)
+            return data
+
+    hedge_stats.record(site, hedged, len(errors), None)
+    raise errors[-1]
+
+
+def chat_completion(messages, model=None, timeout=None, retries=None, site=None, **extra):
+    """
+    Run a chat completion and return the parsed JSON body.
+    With a site (e.g. "chat", "grading") and no explicit model, the site's
+    model chain is used, with hedging and fallback if it has more than one.
+    """
+    if model or site is None:
+        return _chat_completion_once(messages, model or DEFAULT_MODEL, timeout, retries, extra)
+    chain = model_chain(site)
+    if len(chain) == 1:
+        data = _chat_completion_once(messages, chain[0], timeout, retries, extra)
+        hedge_stats.record(site, False, 0, chain[0])
+        return data
+    return _hedged_completion(site, chain, messages, timeout, retries, extra)
+
+
+def complete(messages, model=None, timeout=None, retries=None, site=None, **extra):
+    """Run a chat completion and return just the assistant message text."""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    data = chat_completion(messages, model=model, timeout=timeout, retries=retries, site=site, **extra)
+    return data["choices"][0]["message"]["content"]
+
+
+def _stream_once(messages, model, timeout, retries, extra, deadline):
+    payload = {"model": model, "messages": messages, "stream": True}
+    payload.update(extra)
+
+    response = post_chat(payload, timeout=timeout, retries=retries, stream=True, deadline=deadline)
+    if response.status_code != 200:
+        text = response.text
+        response.close()
+        raise LLMError(f"API Error: {text}", response.status_code, text)
+
+    response.encoding = "utf-8"
+    try:
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            # Blank keep-alives and ": OPENROUTER PROCESSING" comments carry no data
+            if not line or not line.startswith("data:"):
+                continue
+            chunk = line[len("data:"):].strip()
+            if chunk == "[DONE]":
+                break
+            try:
+                data = json.loads(chunk)
+            except ValueError:
+                continue
+            if "error" in data:
+                raise LLMError(f"API Error: {data['error']}", response.status_code, data)
+            _remaining(deadline)
+            for choice in data.get("choices", []):
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+    except requests.RequestException as e:
+        raise LLMError(f"OpenRouter stream interrupted: {e}") from e
+    finally:
+        response.close()
+
+
+def stream_completion(messages, model=None, timeout=None, retries=None, site=None, **extra):
+    """
+    Stream a chat completion from OpenRouter.
+    Yields content deltas (str) as soon as the upstream sends them.
+    With a site, a model that fails before its first delta falls back to
+    the next one in the site's chain. Streams are not hedged: once tokens
+    reach the client the answer cannot be swapped.
+    """
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    chain = [model or DEFAULT_MODEL] if model or site is None else model_chain(site)
+
+    deadline = new_deadline()
+    fallbacks = 0
+    for i, name in enumerate(chain):
+        last = i == len(chain) - 1
+        streamed = False
+        try:
+            for delta in _stream_once(messages, name, timeout, retries if last else 0, extra, deadline):
+                streamed = True
+                yield delta
+        except (LLMError, upstream_limits.Overloaded) as e:
+            if streamed or last:
+                if site is not None:
+                    hedge_stats.record(site, False, fallbacks, None)
+                raise
+            print(f"{name} failed for {site}, falling back to {chain[i + 1]}: {e}")
+            fallbacks += 1
+            continue
+        if site is not None:
+            hedge_stats.record(site, False, fallbacks, name)
+        return
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stop nginx-style proxies from buffering the stream
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(data, event=None):
+    """Format one server-sent event carrying a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def chat_sse(messages, model=None, meta=None, **extra):
+    """
+    Relay a streamed completion as server-sent events.
+    Emits {"delta": ...} events, then a final "done" event with the full
+    answer (plus any meta fields), or an "error" event if the upstream fails.
+    """
+    parts = []
+    try:
+        for delta in stream_completion(messages, model=model, **extra):
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+    except upstream_limits.Overloaded as e:
+        yield sse_event({"error": e.public_message(), "retry_after": e.retry_after}, event="error")
+        return
+    except LLMError as e:
+        print(f"Streaming chat failed: {e}")
+        yield sse_event({"error": "Chatbot API failed"}, event="error")
+        return
+    yield sse_event(dict(meta or {}, answer="".join(parts)), event="done")
+
@@ -0,0 +1,219 @@
+"""
+In-process metrics in the Prometheus text format.
+
+    metrics.init_app(app)                    # per-route latency + in-flight
+    with metrics.track("gemini", "ocr"):      # per-upstream call timer
+        ...
+
+Each process keeps its own counters: under gunicorn every worker reports
+its own series, and the standalone video worker is not included.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+# Seconds; wide enough for both API routes and multi-minute renders
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600,
+)
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [(self.name, key, (), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        out = []
+        for key, series in self._values.items():
+            for bound, count in zip(self.buckets, series["counts"]):
+                out.append((f"{self.name}_bucket", key, (("le", _format_value(bound)),), count))
+            out.append((f"{self.name}_bucket", key, (("le", "+Inf"),), series["count"]))
+            out.append((f"{self.name}_sum", key, (), series["sum"]))
+            out.append((f"{self.name}_count", key, (), series["count"]))
+        return out
+
+
+def _register(metric):
+    _metrics[metric.name] = metric
+    return metric
+
+
+http_request_duration = _register(Histogram(
+    "http_request_duration_seconds", "Flask request latency by route, method and status."
+))
+http_requests_in_flight = _register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled."
+))
+upstream_duration = _register(Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to external services."
+))
+upstream_requests = _register(Counter(
+    "upstream_requests_total", "Calls to external services by outcome (HTTP status, ok or error)."
+))
+upstream_in_flight = _register(Gauge(
+    "upstream_in_flight", "Calls currently admitted by each upstream's limiter."
+))
+upstream_rejected = _register(Counter(
+    "upstream_rejected_total", "Calls turned away by an upstream's limiter (answered with 429)."
+))
+breaker_state = _register(Gauge(
+    "breaker_state", "Circuit breaker per upstream: 0 closed, 1 half-open, 2 open."
+))
+breaker_rejected = _register(Counter(
+    "breaker_rejected_total", "Calls failed fast because the upstream's breaker was open (answered with 503)."
+))
+llm_calls = _register(Counter(
+    "llm_calls_total", "LLM completions by call site (chat, questions, grading, ...)."
+))
+llm_hedged = _register(Counter(
+    "llm_hedged_total", "LLM completions that sent a hedged request to a fallback model."
+))
+llm_fallbacks = _register(Counter(
+    "llm_fallbacks_total", "LLM attempts that failed and moved on to the next model."
+))
+llm_wins = _register(Counter(
+    "llm_wins_total", "LLM completions answered, by call site and winning model."
+))
+llm_hedge_ratio = _register(Gauge(
+    "llm_hedge_ratio", "Share of LLM completions per call site that were hedged."
+))
+
+
+class _Call:
+    """Handle yielded by track(); set .status to record an HTTP status code."""
+
+    def __init__(self):
+        self.status = None
+
+
+@contextmanager
+def track(upstream, operation):
+    """Time one call to an external service and count its outcome."""
+    call = _Call()
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException as e:
+        upstream_requests.inc(upstream=upstream, operation=operation, outcome=type(e).__name__)
+        raise
+    else:
+        outcome = str(call.status) if call.status is not None else "ok"
+        upstream_requests.inc(upstream=upstream, operation=operation, outcome=outcome)
+    finally:
+        upstream_duration.observe(time.perf_counter() - started, upstream=upstream, operation=operation)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in _metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key, extra)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_response():
+    return Response(render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def init_app(app):
+    """Record latency and in-flight requests for every route of app."""
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_started = time.perf_counter()
+        g._metrics_route = _route()
+        http_requests_in_flight.inc(route=g._metrics_route)
+
+    @app.after_request
+    def _observe(response):
+        started = g.pop("_metrics_started", None)
+        if started is not None:
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                route=g._metrics_route, method=request.method, status=response.status_code
+            )
+        return response
+
+    @app.teardown_request
+    def _finish(exc):
+        route = g.pop("_metrics_route", None)
+        if route is not None:
+            http_requests_in_flight.dec(route=route)
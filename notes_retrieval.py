@@ -0,0 +1,144 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+
+from dotenv import load_dotenv
+
+import llm_client
+from cache import TTLCache
+
+load_dotenv()
+
+# Notes shorter than this many tokens are sent whole; retrieval would not save anything
+INLINE_MAX_TOKENS = int(os.getenv("NOTES_INLINE_MAX_TOKENS", "800"))
+CHUNK_WORDS = int(os.getenv("NOTES_CHUNK_WORDS", "120"))
+TOP_K = int(os.getenv("NOTES_TOP_K", "4"))
+
+# Standard BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+index_cache = TTLCache(
+    maxsize=int(os.getenv("NOTES_INDEX_CACHE_SIZE", "64")),
+    ttl=float(os.getenv("NOTES_INDEX_CACHE_TTL", "3600"))
+)
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i in is it its me my "
+    "of on or so that the their them then there these this to was what when where "
+    "which who why will with you your".split()
+)
+
+
+def notes_key(notes):
+    return hashlib.sha256(notes.encode("utf-8")).hexdigest()
+
+
+def tokenize(text):
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def chunk_notes(notes, max_words=None):
+    """
+    Split notes into chunks of about max_words words, breaking on lines so
+    headings, bullets and formulas stay intact. Overlong lines are split.
+    """
+    max_words = max_words or CHUNK_WORDS
+    chunks = []
+    current = []
+    count = 0
+    for line in notes.splitlines():
+        words = len(line.split())
+        if not words:
+            continue
+        if current and count + words > max_words:
+            chunks.append("\n".join(current))
+            current, count = [], 0
+        if words > max_words:
+            parts = line.split()
+            for start in range(0, len(parts), max_words):
+                chunks.append(" ".join(parts[start:start + max_words]))
+            continue
+        current.append(line)
+        count += words
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over the chunks of one version of the notes."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self._term_freqs = [Counter(tokenize(chunk)) for chunk in chunks]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(chunks)) if chunks else 0.0
+        doc_freqs = Counter()
+        for tf in self._term_freqs:
+            doc_freqs.update(tf.keys())
+        n = len(chunks)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    def scores(self, query):
+        terms = [t for t in set(tokenize(query)) if t in self._idf]
+        scores = []
+        for tf, length in zip(self._term_freqs, self._lengths):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self._avg_length or 1))
+            scores.append(sum(
+                self._idf[t] * tf[t] * (BM25_K1 + 1) / (tf[t] + norm)
+                for t in terms if t in tf
+            ))
+        return scores
+
+    def top_k(self, query, k):
+        """Indices of the k best chunks, in document order."""
+        scores = self.scores(query)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        best = [i for i in ranked[:k] if scores[i] > 0]
+        # Nothing matched ("summarize this"): fall back to the opening chunks
+        return sorted(best) if best else list(range(min(k, len(scores))))
+
+
+def get_index(notes):
+    """The BM25 index for this exact notes text, built once per version."""
+    key = notes_key(notes)
+    index = index_cache.get(key)
+    if index is None:
+        index = BM25Index(chunk_notes(notes))
+        index_cache.set(key, index)
+    return index
+
+
+def retrieval_query(user_message, chat_history):
+    """The question plus the previous user turn, so follow-ups keep their topic."""
+    previous = [m.get("content") or "" for m in chat_history or [] if m.get("role") == "user"]
+    return f"{previous[-1]} {user_message}" if previous else user_message
+
+
+def select_context(notes, query, k=None):
+    """
+    Pick the notes text to send with a question.
+    Returns (context, info) where info reports the chunks used and the
+    number of tokens injected.
+    """
+    notes = notes or ""
+    if llm_client.estimate_tokens(notes) <= INLINE_MAX_TOKENS:
+        return notes, {"mode": "full", "tokens": llm_client.estimate_tokens(notes)}
+
+    index = get_index(notes)
+    chosen = index.top_k(query, k or TOP_K)
+    context = "\n...\n".join(index.chunks[i] for i in chosen)
+    return context, {
+        "mode": "retrieved",
+        "chunks": chosen,
+        "total_chunks": len(index.chunks),
+        "tokens": llm_client.estimate_tokens(context),
+        "notes_tokens": llm_client.estimate_tokens(notes),
+    }
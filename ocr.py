@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google import genai
+from google.genai import types
+from dotenv import load_dotenv
+
+import circuit_breaker
+import upstream_limits
+from cache import SQLiteCache
+
+load_dotenv()
+
+OCR_MODEL = os.getenv("OCR_MODEL", "gemini-2.5-flash")
+# Upper bound on Gemini calls in flight for a single upload
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "4"))
+
+# Bump whenever OCR_PROMPT changes so stale cached notes stop matching
+OCR_PROMPT_VERSION = "1"
+OCR_PROMPT = (
+    "Extract all the text from this image and "
+    "After extracting, carefully review the text and correct any mistakes "
+    "or misread characters. THEN, CONVERT the text into a neatly formatted notes with logical understanding."
+    " Do not include any other extra text like 'okay here's your message' or something similar. ONLY include the neatly formatted output."
+)
+
+ocr_cache = SQLiteCache(
+    os.getenv("OCR_CACHE_PATH", "cache/ocr_cache.sqlite3"),
+    max_bytes=int(os.getenv("OCR_CACHE_MAX_MB", "200")) * 1024 * 1024,
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return a shared Gemini client so pages reuse its connection pool."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # GEMINI_BASE_URL points OCR at another endpoint (e.g. the bench stubs)
+                base_url = os.getenv("GEMINI_BASE_URL")
+                _client = genai.Client(
+                    api_key=os.getenv("GOOGLE_API_KEY"),
+                    http_options=types.HttpOptions(base_url=base_url) if base_url else None
+                )
+    return _client
+
+
+def extract_page(image_bytes, mime_type):
+    """Run a single image through Gemini and return the formatted notes."""
+    with circuit_breaker.guard("gemini", "generate_content"):
+        response = get_client().models.generate_content(
+            model=OCR_MODEL,
+            contents=[
+                types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
+                OCR_PROMPT,
+            ]
+        )
+    return response.text
+
+
+def cache_key(image_bytes):
+    """Content address for an image under the current model and prompt."""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{OCR_MODEL}:{OCR_PROMPT_VERSION}:{digest}"
+
+
+def _run_page(page):
+    # Carried through so extract_uploads can group pages by upload
+    tag = {"source": page["source"]} if "source" in page else {}
+    key = cache_key(page["data"])
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        print(f"\nOCR cache hit: {page['filename']}")
+        return dict(tag, filename=page["filename"], status="success", cached=True, text=cached)
+
+    print(f"\nProcessing image: {page['filename']}")
+    try:
+        text = extract_page(page["data"], page["mime_type"])
+        ocr_cache.set(key, text)
+        return dict(tag, filename=page["filename"], status="success", cached=False, text=text)
+    except upstream_limits.Overloaded as e:
+        # Gemini is saturated or its breaker is open: report it for this page only
+        print(f"Skipping image {page['filename']}: {e}")
+        return upstream_limits.rejected_result(e, filename=page["filename"], **tag)
+    except Exception as e:
+        print(f"Error processing image {page['filename']}: {e}")
+        return dict(tag, filename=page["filename"], status="error", error=str(e))
+
+
+def extract_pages(pages, max_workers=None):
+    """
+    OCR pages concurrently.
+    Each page is a dict with filename, mime_type and data (bytes). pages may
+    be a generator: each page is submitted as soon as it is produced.
+    Returns one result dict per page in the same order as the input; a page
+    that fails comes back with status "error" instead of raising.
+    """
+    workers = max_workers or OCR_CONCURRENCY
+    if isinstance(pages, list):
+        if not pages:
+            return []
+        workers = min(workers, len(pages))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(_run_page, pages))
+
+
+def extract_uploads(uploads, prepare=None):
+    """
+    OCR uploads, checking the cache by the SHA-256 of each upload as it was
+    received, before any preprocessing, so a repeat handout skips the
+    decode/resize work as well as Gemini. Misses go through prepare (e.g.
+    image_prep.iter_pages, which must keep each page's "source" tag) and
+    are OCR'd page by page; an upload whose pages all succeed is cached
+    under its raw key. Returns page results in upload order.
+    """
+    cached = {}
+    misses = []
+    for index, upload in enumerate(uploads):
+        text = ocr_cache.get(cache_key(upload["data"]))
+        if text is None:
+            misses.append(dict(upload, source=index))
+        else:
+            print(f"\nOCR cache hit: {upload['filename']}")
+            cached[index] = [{"filename": upload["filename"], "status": "success", "cached": True, "text": text}]
+
+    by_upload = {}
+    if misses:
+        pages = prepare(misses) if prepare else misses
+        for result in extract_pages(pages):
+            by_upload.setdefault(result.pop("source"), []).append(result)
+    for upload in misses:
+        results = by_upload.get(upload["source"], [])
+        if results and all(r["status"] == "success" for r in results):
+            ocr_cache.set(cache_key(upload["data"]), "\n".join(r["text"] for r in results))
+
+    return [r for index in range(len(uploads)) for r in cached.get(index) or by_upload.get(index, [])]
+
+
+def join_pages(results):
+    """Stitch successful page texts back together in upload order."""
+    return "".join(r["text"] + "\n" for r in results if r["status"] == "success")
+
+
+def summarize_pages(results):
+    """Per-page status for the response, without repeating the page text."""
+    return [{k: v for k, v in r.items() if k != "text"} for r in results]
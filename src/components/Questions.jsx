@@ -452,20 +452,23 @@ export default function Questions() {
   };
 
   // --- Video Generation Logic ---
-  const pollVideo = async () => {
-    const timestamp = new Date().getTime();
-    const videoCheckUrl = `http://127.0.0.1:5000/video?t=${timestamp}`;
-
+  // Poll our own job (not the latest one on the server) until its final render is ready
+  const pollVideo = async (jobId) => {
     try {
-      const response = await fetch(videoCheckUrl, { method: 'HEAD' });
-      if (response.ok) {
-        setVideoUrl(videoCheckUrl);
+      const response = await fetch(`http://127.0.0.1:5000/video-jobs/${jobId}`);
+      const job = response.ok ? await response.json() : null;
+      if (job && job.status === 'failed') {
+        console.error('Video generation failed:', job.error);
+        alert('Video generation failed');
+        setIsGeneratingVideo(false);
+      } else if (job && job.result_url) {
+        setVideoUrl(`http://127.0.0.1:5000${job.result_url}`);
         setIsGeneratingVideo(false);
       } else {
-        setTimeout(pollVideo, 3000);
+        setTimeout(() => pollVideo(jobId), 3000);
       }
     } catch (err) {
-      setTimeout(pollVideo, 3000);
+      setTimeout(() => pollVideo(jobId), 3000);
     }
   };
 
@@ -483,7 +486,7 @@ export default function Questions() {
       if (response.ok) {
         const result = await response.json();
         if (result.status === 'started') {
-          pollVideo();
+          pollVideo(result.job_id);
         }
       } else {
         alert('Error starting video generation');
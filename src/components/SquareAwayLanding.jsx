@@ -309,7 +309,7 @@ export default function SquareAwayLanding() {
 
   const handleFiles = (selectedFiles) => {
     const imageFiles = Array.from(selectedFiles).filter(file =>
-      file.type.startsWith('image/')
+      file.type.startsWith('image/') || file.type === 'application/pdf'
     );
     setFiles(imageFiles);
   };
@@ -388,28 +388,32 @@ export default function SquareAwayLanding() {
     }
   };
 
-  const pollVideo = async () => {
-    const timestamp = new Date().getTime();
-    const videoCheckUrl = `http://127.0.0.1:5000/video?t=${timestamp}`;
-
+  // Poll our own job (not the latest one on the server) until its final render is ready
+  const pollVideo = async (jobId) => {
     try {
-      const response = await fetch(videoCheckUrl, { method: 'HEAD' });
-      if (response.ok) {
-        setVideoUrl(videoCheckUrl);
+      const response = await fetch(`http://127.0.0.1:5000/video-jobs/${jobId}`);
+      const job = response.ok ? await response.json() : null;
+      if (job && job.status === 'failed') {
+        console.error('Video generation failed:', job.error);
+        alert('Video generation failed');
+        setIsGeneratingVideo(false);
+      } else if (job && job.result_url) {
+        const videoResultUrl = `http://127.0.0.1:5000${job.result_url}`;
+        setVideoUrl(videoResultUrl);
         setIsGeneratingVideo(false);
 
         // Upload to Supabase Storage and update note
         // Use noteIdRef which was set when the note was created
-        uploadVideoToSupabase(noteIdRef.current);
+        uploadVideoToSupabase(noteIdRef.current, videoResultUrl);
       } else {
-        setTimeout(pollVideo, 3000);
+        setTimeout(() => pollVideo(jobId), 3000);
       }
     } catch (err) {
-      setTimeout(pollVideo, 3000);
+      setTimeout(() => pollVideo(jobId), 3000);
     }
   };
 
-  const uploadVideoToSupabase = async (noteId) => {
+  const uploadVideoToSupabase = async (noteId, videoResultUrl) => {
     // Use the passed noteId parameter instead of relying on state
     const uploadNoteId = noteId || currentNoteId;
 
@@ -420,7 +424,7 @@ export default function SquareAwayLanding() {
 
     try {
       console.log('Fetching video from backend...');
-      const response = await fetch('http://127.0.0.1:5000/video');
+      const response = await fetch(videoResultUrl);
       if (!response.ok) {
         throw new Error(`Failed to fetch video: ${response.status}`);
       }
@@ -513,7 +517,7 @@ export default function SquareAwayLanding() {
       if (response.ok) {
         const result = await response.json();
         if (result.status === 'started') {
-          pollVideo();
+          pollVideo(result.job_id);
         }
       } else {
         alert('Error starting video generation');
@@ -599,7 +603,7 @@ export default function SquareAwayLanding() {
             <input
               type="file"
               multiple
-              accept="image/*"
+              accept="image/*,application/pdf"
               ref={fileInputRef}
               className="hidden"
               onChange={handleFileChange}
@@ -128,7 +128,7 @@ export default function VideosPage() {
                 const result = await response.json();
                 if (result.status === 'started') {
                     setLoadingMessage('Generating explanation...');
-                    pollVideo();
+                    pollVideo(result.job_id);
                 }
             } else {
                 alert('Error starting video generation');
@@ -141,31 +141,35 @@ export default function VideosPage() {
         }
     };
 
-    const pollVideo = async () => {
-        const timestamp = new Date().getTime();
-        const videoCheckUrl = `http://127.0.0.1:5000/video?t=${timestamp}`;
-
+    // Poll our own job (not the latest one on the server) until its final render is ready
+    const pollVideo = async (jobId) => {
         try {
-            const response = await fetch(videoCheckUrl, { method: 'HEAD' });
-            if (response.ok) {
-                setCurrentVideoUrl(videoCheckUrl);
+            const response = await fetch(`http://127.0.0.1:5000/video-jobs/${jobId}`);
+            const job = response.ok ? await response.json() : null;
+            if (job && job.status === 'failed') {
+                console.error('Video generation failed:', job.error);
+                alert('Video generation failed');
+                setIsGenerating(false);
+            } else if (job && job.result_url) {
+                const videoResultUrl = `http://127.0.0.1:5000${job.result_url}`;
+                setCurrentVideoUrl(videoResultUrl);
                 setIsGenerating(false);
                 setPrompt(''); // Clear input on success
                 // Upload to storage and save URL, passing the prompt content
-                uploadVideoAndCreateNote(promptRef.current);
+                uploadVideoAndCreateNote(promptRef.current, videoResultUrl);
             } else {
-                setTimeout(pollVideo, 3000);
+                setTimeout(() => pollVideo(jobId), 3000);
             }
         } catch (err) {
-            setTimeout(pollVideo, 3000);
+            setTimeout(() => pollVideo(jobId), 3000);
         }
     };
 
-    const uploadVideoAndCreateNote = async (contentParams) => {
+    const uploadVideoAndCreateNote = async (contentParams, videoResultUrl) => {
         if (!user) return;
 
         try {
-            const response = await fetch('http://127.0.0.1:5000/video');
+            const response = await fetch(videoResultUrl);
             if (!response.ok) throw new Error('Failed to fetch video blob');
 
             const blob = await response.blob();
@@ -0,0 +1,94 @@
+import base64
+import json
+
+import pytest
+from flask import Flask
+
+import assignment_grading
+
+
+def student_token(sub):
+    """An unsigned JWT with just a sub claim; the server never verifies it."""
+    payload = base64.urlsafe_b64encode(json.dumps({"sub": sub}).encode()).decode().rstrip("=")
+    return f"Bearer header.{payload}.signature"
+
+
+@pytest.fixture
+def app_context():
+    with Flask(__name__).app_context():
+        yield
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """Rows passed to Supabase, instead of sending them."""
+    calls = []
+
+    class Response:
+        status_code = 201
+        text = ""
+
+    def save(rows, access_token):
+        calls.append(rows)
+        return Response()
+
+    monkeypatch.setattr(assignment_grading, "save_assignment_progress", save)
+    monkeypatch.setattr(assignment_grading, "verdict_cache", assignment_grading.TTLCache(maxsize=16, ttl=60))
+    return calls
+
+
+def evaluate(items):
+    response, status = assignment_grading.evaluate_answers_response(
+        {"items": items, "assignment_id": "a1", "student_id": "s1"}, student_token("s1")
+    )
+    return response.get_json(), status
+
+
+ESSAY = {"question": "Why is the sky blue?", "user_answer": "Rayleigh scattering", "correct_answer": "scattering"}
+NUMERIC = {"question": "2 + 2?", "user_answer": "4", "correct_answer": "4"}
+
+
+def test_llm_verdicts_are_saved(app_context, saves, monkeypatch):
+    monkeypatch.setattr(assignment_grading, "_grade_with_llm",
+                        lambda *args: {"correct": True, "feedback": "Good"})
+    body, status = evaluate([ESSAY, NUMERIC])
+
+    assert status == 200
+    assert [r["grader"] for r in body["results"]] == ["llm", "local"]
+    assert body["saved"] == 1
+    assert saves[0][0]["score"] == 100
+
+
+def test_fallback_verdicts_are_not_saved(app_context, saves, monkeypatch):
+    # LLM call failed or the OpenRouter breaker is open
+    monkeypatch.setattr(assignment_grading, "_grade_with_llm", lambda *args: None)
+    body, status = evaluate([ESSAY, NUMERIC])
+
+    assert status == 200
+    assert body["results"][0]["grader"] == "fallback"
+    assert body["saved"] is False
+    assert "error" in body
+    assert saves == []
+
+
+@pytest.mark.parametrize("reply, expected", [
+    ('{"correct": false, "feedback": "No"}', False),
+    ('{"correct": "false", "feedback": "No"}', False),
+    ('{"correct": "True", "feedback": "Yes"}', True),
+    ('{"correct": "maybe", "feedback": "?"}', None),
+    ('{"correct": 1, "feedback": "?"}', None),
+    ('{"feedback": "?"}', None),
+])
+def test_llm_verdict_must_be_a_boolean(monkeypatch, reply, expected):
+    monkeypatch.setattr(assignment_grading.llm_client, "complete", lambda *args, **kwargs: reply)
+    verdict = assignment_grading._grade_with_llm("Q", "answer", "key")
+    assert (verdict if verdict is None else verdict["correct"]) is expected
+
+
+def test_unreadable_verdicts_are_not_cached(saves, monkeypatch):
+    monkeypatch.setattr(assignment_grading.llm_client, "complete",
+                        lambda *args, **kwargs: '{"correct": "maybe"}')
+    result = assignment_grading.grade_answer(ESSAY["question"], ESSAY["user_answer"], ESSAY["correct_answer"])
+
+    assert result["grader"] == "fallback"
+    assert assignment_grading.verdict_cache.stats()["entries"] == 0
@@ -0,0 +1,124 @@
+import time
+
+import pytest
+
+import circuit_breaker
+
+
+def make_breaker(**kwargs):
+    settings = dict(failure_rate=0.5, min_calls=4, window=30, open_seconds=0.05, half_open_calls=1)
+    settings.update(kwargs)
+    return circuit_breaker.CircuitBreaker("test", **settings)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.allow()
+        breaker.record(True)
+
+
+def test_opens_once_enough_calls_fail():
+    breaker = make_breaker()
+    for failed in (True, True, True):
+        breaker.allow()
+        breaker.record(failed)
+    # Below min_calls the error rate is not trusted yet
+    assert breaker.state == circuit_breaker.CLOSED
+
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == circuit_breaker.OPEN
+    assert breaker.trips == 1
+
+
+def test_stays_closed_below_the_failure_rate():
+    breaker = make_breaker()
+    for failed in (True, False, False, False, True, False):
+        breaker.allow()
+        breaker.record(failed)
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.stats()["error_rate"] == pytest.approx(2 / 6)
+
+
+def test_calls_turned_away_by_the_limiter_do_not_count():
+    breaker = make_breaker()
+    for _ in range(10):
+        breaker.allow()
+        breaker.record(None)
+    assert breaker.stats()["calls"] == 0
+
+
+def test_open_half_open_closed():
+    breaker = make_breaker()
+    trip(breaker)
+
+    with pytest.raises(circuit_breaker.CircuitOpen) as excinfo:
+        breaker.allow()
+    assert 0 < excinfo.value.retry_after <= breaker.open_seconds
+    assert excinfo.value.status_code == 503
+    assert breaker.rejected == 1
+
+    time.sleep(breaker.open_seconds)
+    # One trial call is let through; others wait for its outcome
+    breaker.allow()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    with pytest.raises(circuit_breaker.CircuitOpen) as excinfo:
+        breaker.allow()
+    assert excinfo.value.retry_after == 1.0
+
+    breaker.record(False)
+    assert breaker.state == circuit_breaker.CLOSED
+    # The failures that tripped it are forgotten
+    assert breaker.stats()["calls"] == 0
+    breaker.allow()
+
+
+def test_failed_trial_call_reopens():
+    breaker = make_breaker()
+    trip(breaker)
+    time.sleep(breaker.open_seconds)
+
+    breaker.allow()
+    breaker.record(True)
+    assert breaker.state == circuit_breaker.OPEN
+    assert breaker.trips == 2
+    with pytest.raises(circuit_breaker.CircuitOpen):
+        breaker.allow()
+
+
+def test_trial_call_turned_away_by_the_limiter_frees_its_probe():
+    breaker = make_breaker()
+    trip(breaker)
+    time.sleep(breaker.open_seconds)
+
+    breaker.allow()
+    breaker.record(None)
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    breaker.allow()
+
+
+@pytest.mark.parametrize("status, error, failed", [
+    (200, None, False),
+    (404, None, False),
+    (503, None, True),
+    (None, ConnectionError("reset"), True),
+    (None, type("HTTPError", (Exception,), {"status_code": 400})(), False),
+])
+def test_is_failure(status, error, failed):
+    assert circuit_breaker.is_failure(status=status, error=error) is failed
+
+
+def test_guard_counts_5xx_answers_and_fails_fast_once_open(monkeypatch):
+    breaker = make_breaker(min_calls=2)
+    monkeypatch.setitem(circuit_breaker._breakers, "test", breaker)
+
+    for _ in range(2):
+        with circuit_breaker.guard("test", "op") as call:
+            call.status = 502
+    assert breaker.state == circuit_breaker.OPEN
+
+    reached = []
+    with pytest.raises(circuit_breaker.CircuitOpen):
+        with circuit_breaker.guard("test", "op"):
+            reached.append(True)
+    assert reached == []
@@ -0,0 +1,124 @@
+import pytest
+
+import grading
+
+
+def verdict(user_answer, correct_answer, **kwargs):
+    """True/False from the local grader, or None when it defers to the LLM."""
+    result = grading.grade_locally("Q", user_answer, correct_answer, **kwargs)
+    return None if result is None else result["correct"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1,200", (1200.0, "")),
+    ("3/4", (0.75, "")),
+    ("3 / 4", (0.75, "")),
+    ("-2.5e3", (-2500.0, "")),
+    ("1e3", (1000.0, "")),
+    ("3 x 10^8", (3e8, "")),
+    ("3×10^8", (3e8, "")),
+    ("45%", (45.0, "%")),
+    ("x = 7 m", (7.0, "m")),
+    ("12cm", (12.0, "cm")),
+    ("9.8 m/s^2", (9.8, "m/s^2")),
+    ("12 furlongs", (12.0, "furlongs")),
+])
+def test_parse_number(text, expected):
+    assert grading.parse_number(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text", ["2x", "2x^2", "5 x", "5m", "2n", "2, 3", "1 1/2", "1,20", "seven"])
+def test_parse_number_rejects_non_numbers(text):
+    assert grading.parse_number(text) is None
+
+
+@pytest.mark.parametrize("user_answer, correct_answer", [
+    ("2", "2x"),
+    ("2", "2x^2"),
+    ("3", "3 x 10^8"),
+    ("23", "2, 3"),
+    ("2", "2n"),
+])
+def test_variables_and_lists_are_not_dropped(user_answer, correct_answer):
+    assert verdict(user_answer, correct_answer) is not True
+
+
+@pytest.mark.parametrize("user_answer, correct_answer", [
+    ("1000", "1e3"),
+    ("3e8", "3 x 10^8"),
+    ("4.0", "4"),
+    ("0.5", "50%"),
+    ("1,200", "1200"),
+    ("12", "12 cm"),
+    ("5m", "5 m"),
+    ("45", "45%"),
+    ("45%", "45"),
+    ("45%", "0.45"),
+    ("0.33", "1/3"),
+    ("3.14", "3.14159"),
+    ("9.8", "9.81"),
+    ("2.5e3", "2512"),
+    ("33.3%", "1/3"),
+    ("x^2 + 2x + 1", "(x+1)^2"),
+])
+def test_equivalent_answers_are_accepted(user_answer, correct_answer):
+    assert verdict(user_answer, correct_answer) is True
+
+
+@pytest.mark.parametrize("user_answer, correct_answer", [
+    ("3", "3.14159"),
+    ("3.2", "3.14159"),
+    ("0.2", "1/3"),
+    ("0.45%", "45%"),
+    ("4", "5"),
+])
+def test_wrong_numbers_are_rejected(user_answer, correct_answer):
+    assert verdict(user_answer, correct_answer) is False
+
+
+def test_rounding_is_read_from_the_decimals_written():
+    assert grading.rounding_tolerance("0.33") == pytest.approx(0.005)
+    assert grading.rounding_tolerance("2.5e3") == pytest.approx(50)
+    assert grading.rounding_tolerance("3 x 10^8") == 0
+    assert grading.rounding_tolerance("1/3") == 0
+
+
+@pytest.mark.parametrize("user_answer, correct_answer", [
+    ("5x", "5"),
+    ("3, 2", "2, 3"),
+    ("1 1/2", "3/2"),
+    ("5 cm", "5 m"),
+    ("9.81", "9.8"),
+])
+def test_ambiguous_answers_go_to_the_llm(user_answer, correct_answer):
+    assert verdict(user_answer, correct_answer) is None
+
+
+@pytest.mark.parametrize("user_answer, correct_answer", [
+    ("yes", "Right"),
+    ("no", "n"),
+    ("false", "f"),
+])
+def test_true_false_synonyms_need_a_true_false_question(user_answer, correct_answer):
+    assert verdict(user_answer, correct_answer) is not True
+
+
+@pytest.mark.parametrize("user_answer, correct_answer, question_type, expected", [
+    ("yes", "True", None, True),
+    ("F", "false", None, True),
+    ("no", "True", None, False),
+    ("right", "correct", "boolean", True),
+    ("y", "False", "true/false", False),
+])
+def test_true_false(user_answer, correct_answer, question_type, expected):
+    assert verdict(user_answer, correct_answer, question_type=question_type) is expected
+
+
+def test_multiple_choice_by_letter_or_text():
+    options = ["Nucleus", "Mitochondria", "Ribosome"]
+    assert verdict("b", "Mitochondria", question_type="mcq", options=options) is True
+    assert verdict("Ribosome", "B", question_type="mcq", options=options) is False
+
+
+def test_long_expressions_are_left_to_the_llm():
+    assert grading.parse_expression("x+" * 200 + "x") is None
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import circuit_breaker
+import upstream_limits
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_rejects_when_no_slot_frees_up_in_time():
+    limiter = upstream_limits.UpstreamLimiter("test", concurrency=1, max_wait=0.05)
+    limiter.acquire()
+    with pytest.raises(upstream_limits.Overloaded) as excinfo:
+        limiter.acquire()
+
+    assert excinfo.value.retry_after == pytest.approx(0.05)
+    assert limiter.stats()["rejected"] == 1
+    limiter.release()
+    with limiter.slot():
+        assert limiter.stats()["active"] == 1
+
+
+def test_rejects_immediately_when_the_queue_is_full():
+    limiter = upstream_limits.UpstreamLimiter("test", concurrency=1, max_wait=1.0, max_queue=1)
+    limiter.acquire()
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(limiter.acquire()))
+    waiter.start()
+    wait_until(lambda: limiter.stats()["waiting"] == 1)
+
+    started = time.monotonic()
+    with pytest.raises(upstream_limits.Overloaded) as excinfo:
+        limiter.acquire()
+    # Turned away without waiting; told to come back after a full wait
+    assert time.monotonic() - started < 0.5
+    assert excinfo.value.retry_after == pytest.approx(1.0)
+
+    limiter.release()
+    waiter.join()
+    assert admitted == [None]
+    limiter.release()
+
+
+def test_rejects_when_the_rate_limit_wait_is_too_long():
+    limiter = upstream_limits.UpstreamLimiter("test", concurrency=4, rate=1.0, burst=1, max_wait=0.2)
+    with limiter.slot():
+        pass
+    with pytest.raises(upstream_limits.Overloaded) as excinfo:
+        limiter.acquire()
+
+    # The next token is about a second away
+    assert excinfo.value.retry_after == pytest.approx(1.0, abs=0.05)
+    assert excinfo.value.retry_after_header() == "1"
+    # The slot was released and the token refunded
+    assert limiter.stats()["active"] == 0
+    assert limiter.bucket.reserve() == pytest.approx(1.0, abs=0.05)
+
+
+def test_waits_for_a_token_within_max_wait():
+    limiter = upstream_limits.UpstreamLimiter("test", concurrency=4, rate=20.0, burst=1, max_wait=1.0)
+    with limiter.slot():
+        pass
+    started = time.monotonic()
+    with limiter.slot():
+        assert time.monotonic() - started == pytest.approx(0.05, abs=0.04)
+
+
+def test_pause_holds_back_an_unrated_bucket():
+    bucket = upstream_limits.TokenBucket(0, 0)
+    assert bucket.reserve() == 0
+    bucket.pause(5)
+    assert bucket.reserve() == pytest.approx(5, abs=0.1)
+
+
+@pytest.mark.parametrize("retry_after, header", [(0.2, "1"), (1.0, "1"), (2.1, "3")])
+def test_retry_after_header_rounds_up_to_whole_seconds(retry_after, header):
+    assert upstream_limits.Overloaded("test", retry_after).retry_after_header() == header
+
+
+@pytest.mark.parametrize("error, status", [
+    (upstream_limits.Overloaded("openrouter", 2.5), 429),
+    (circuit_breaker.CircuitOpen("openrouter", 7.2), 503),
+])
+def test_overloaded_response(error, status):
+    with Flask(__name__).app_context():
+        response = upstream_limits.overloaded_response(error)
+
+    assert response.status_code == status
+    assert response.headers["Retry-After"] == error.retry_after_header()
+    assert response.get_json() == {"error": error.public_message(), "retry_after": error.retry_after}
+
+
+def test_batches_fail_only_when_every_item_was_rejected():
+    short, long = upstream_limits.Overloaded("test", 1.0), upstream_limits.Overloaded("test", 3.0)
+    partial = [upstream_limits.rejected_result(short, id=1), {"id": 2, "status": "success"}]
+    upstream_limits.raise_if_all_rejected(partial)
+    assert partial[0] == {"id": 1, "status": "error", "error": short.public_message(), "retry_after": 1.0}
+
+    rejected = [upstream_limits.rejected_result(short), upstream_limits.rejected_result(long)]
+    with pytest.raises(upstream_limits.Overloaded) as excinfo:
+        upstream_limits.raise_if_all_rejected(rejected)
+    assert excinfo.value is long
+    assert all("rejected" not in r for r in rejected)
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+from flask import Flask
+from werkzeug.http import http_date
+
+import video_delivery
+
+VIDEO = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "Explainer.mp4"
+    path.write_bytes(VIDEO)
+    return path
+
+
+@pytest.fixture
+def client(video):
+    app = Flask(__name__)
+
+    @app.route("/video")
+    def serve():
+        return video_delivery.send_video(str(video), "Explainer.mp4")
+
+    return app.test_client()
+
+
+def rewrite(video):
+    """Replace the file's contents (same size) and move its mtime forward."""
+    mtime_ns = os.stat(video).st_mtime_ns
+    video.write_bytes(VIDEO[::-1])
+    os.utime(video, ns=(mtime_ns, mtime_ns + 10 ** 9))
+
+
+def etag_of(client):
+    return client.get("/video").headers["ETag"]
+
+
+def test_full_download(client):
+    response = client.get("/video")
+    assert response.status_code == 200
+    assert response.data == VIDEO
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Content-Length"] == str(len(VIDEO))
+
+
+@pytest.mark.parametrize("header, start, stop", [
+    ("bytes=10-19", 10, 20),
+    ("bytes=1000-", 1000, len(VIDEO)),
+    ("bytes=-24", len(VIDEO) - 24, len(VIDEO)),
+    ("bytes=1000-5000", 1000, len(VIDEO)),
+])
+def test_range_requests(client, header, start, stop):
+    response = client.get("/video", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.data == VIDEO[start:stop]
+    assert response.headers["Content-Range"] == f"bytes {start}-{stop - 1}/{len(VIDEO)}"
+    assert response.headers["Content-Length"] == str(stop - start)
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/video", headers={"Range": f"bytes={len(VIDEO)}-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(VIDEO)}"
+    assert response.data == b""
+
+
+def test_multipart_ranges_get_the_whole_file(client):
+    response = client.get("/video", headers={"Range": "bytes=0-9,20-29"})
+    assert response.status_code == 200
+    assert response.data == VIDEO
+
+
+def test_not_modified(client, video):
+    assert client.get("/video", headers={"If-None-Match": etag_of(client)}).status_code == 304
+    since = http_date(os.stat(video).st_mtime + 1)
+    assert client.get("/video", headers={"If-Modified-Since": since}).status_code == 304
+
+
+def test_changed_file_is_sent_again(client, video):
+    etag = etag_of(client)
+    rewrite(video)
+    response = client.get("/video", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.data == VIDEO[::-1]
+
+
+def test_if_range_resumes_only_the_same_file(client, video):
+    etag = etag_of(client)
+    headers = {"Range": "bytes=10-19", "If-Range": etag}
+    assert client.get("/video", headers=headers).status_code == 206
+
+    rewrite(video)
+    response = client.get("/video", headers=headers)
+    # A stale If-Range means the client's partial copy is useless
+    assert response.status_code == 200
+    assert response.data == VIDEO[::-1]
+
+
+def test_if_range_by_date(client, video):
+    last_modified = client.get("/video").headers["Last-Modified"]
+    response = client.get("/video", headers={"Range": "bytes=0-3", "If-Range": last_modified})
+    assert response.status_code == 206
+    assert response.data == VIDEO[:4]
+
+
+def test_accel_redirect_hands_off_to_the_proxy(client, video, monkeypatch):
+    monkeypatch.setattr(video_delivery, "ACCEL_REDIRECT_PREFIX", "/protected/")
+    monkeypatch.setattr(video_delivery, "ACCEL_REDIRECT_ROOT", str(video.parent))
+    response = client.get("/video", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 200
+    assert response.headers["X-Accel-Redirect"] == "/protected/Explainer.mp4"
+    assert response.data == b""
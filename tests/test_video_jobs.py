@@ -0,0 +1,55 @@
+import pytest
+
+import llm_client
+import video_jobs
+import video_pipeline
+import video_worker
+
+SILENT_REPLY = "Manim\n```python\nfrom manim import *\nclass Explainer(Scene):\n    pass\n```"
+
+
+@pytest.fixture
+def jobs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(video_jobs, "JOBS_DIR", tmp_path)
+    monkeypatch.setattr(video_jobs, "JOBS_DB_PATH", tmp_path / "video_jobs.sqlite3")
+    monkeypatch.setattr(video_jobs, "_initialized", False)
+    return tmp_path
+
+
+@pytest.fixture
+def stub_pipeline(monkeypatch):
+    """LLM calls and Manim replaced by stubs that write a fake render."""
+    def render_script(job_dir, script_text, quality="h"):
+        path = video_pipeline.rendered_video_path(job_dir, quality)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"mp4-" + quality.encode())
+        return path
+
+    monkeypatch.setattr(video_pipeline, "convert_to_latex", lambda text: text)
+    monkeypatch.setattr(video_pipeline, "render_script", render_script)
+    monkeypatch.setattr(llm_client, "chat_completion", lambda messages, site=None: {
+        "choices": [{"message": {"content": SILENT_REPLY}}]
+    })
+
+
+def run_one_job(preview):
+    video_jobs.enqueue("What is a derivative?", preview=preview)
+    job = video_jobs.claim_next("test-worker")
+    video_worker.run_job(job)
+    return video_jobs.get_job(job["id"])
+
+
+@pytest.mark.parametrize("preview", [False, True])
+def test_job_without_voiceover_keeps_its_video(jobs_dir, stub_pipeline, preview):
+    job = run_one_job(preview)
+
+    assert job["status"] == video_jobs.DONE
+    job_path = jobs_dir / job["id"]
+    assert not (job_path / "media").exists()
+    assert video_jobs.video_path_for(job, "final") == (video_jobs.FINAL, job_path / "Explainer.mp4")
+    assert (job_path / "Explainer.mp4").read_bytes() == b"mp4-h"
+    expected_tiers = [video_jobs.PREVIEW, video_jobs.FINAL] if preview else [video_jobs.FINAL]
+    assert video_jobs.public_view(job)["tiers_available"] == expected_tiers
+    if preview:
+        assert (job_path / "Explainer_preview.mp4").read_bytes() == b"mp4-l"
+
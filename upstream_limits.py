@@ -0,0 +1,215 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import jsonify
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# How long a request may wait for a slot or a token before it is turned
+# away with 429, and how many may wait per upstream at once
+MAX_WAIT_SECONDS = float(os.getenv("UPSTREAM_MAX_WAIT_SECONDS", "2"))
+MAX_QUEUE = int(os.getenv("UPSTREAM_MAX_QUEUE", "16"))
+
+# name: (max concurrent calls, sustained calls per second (0 = no limit), burst)
+DEFAULT_LIMITS = {
+    "openrouter": (8, 4.0, 8),
+    "gemini": (8, 0, 0),
+    "supabase": (16, 0, 0),
+}
+
+
+class Overloaded(Exception):
+    """Raised when an upstream's limiter cannot admit a call in time."""
+
+    status_code = 429
+
+    def __init__(self, upstream, retry_after, message=None):
+        super().__init__(message or f"{upstream} is overloaded, retry after {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+    def public_message(self):
+        return f"Too many requests to {self.upstream}, please retry shortly"
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to burst; rate 0 disables it."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how long to wait before using it."""
+        if not self.rate:
+            return max(0.0, self._paused_until - time.monotonic())
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def refund(self):
+        if self.rate:
+            with self._lock:
+                self._tokens = min(self.burst, self._tokens + 1)
+
+    def pause(self, seconds):
+        """Hold back new calls, e.g. after the upstream itself answered 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class UpstreamLimiter:
+    """
+    Admission control for one upstream: a semaphore bounds concurrent
+    calls, a token bucket bounds the call rate, and at most max_queue
+    callers may wait (up to max_wait seconds) before getting Overloaded.
+    """
+
+    def __init__(self, name, concurrency, rate=0, burst=0, max_wait=None, max_queue=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_wait = MAX_WAIT_SECONDS if max_wait is None else max_wait
+        self.max_queue = MAX_QUEUE if max_queue is None else max_queue
+        self.bucket = TokenBucket(rate, burst or concurrency)
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.active = 0
+        self.rejected = 0
+
+    def _reject(self, retry_after):
+        with self._lock:
+            self.rejected += 1
+        metrics.upstream_rejected.inc(upstream=self.name)
+        raise Overloaded(self.name, retry_after)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.max_wait
+        with self._lock:
+            full = self.waiting >= self.max_queue
+            if not full:
+                self.waiting += 1
+        if full:
+            self._reject(self.max_wait)
+        try:
+            got_slot = self._slots.acquire(timeout=self.max_wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not got_slot:
+            self._reject(self.max_wait)
+
+        wait = self.bucket.reserve()
+        if time.monotonic() + wait > deadline:
+            self.bucket.refund()
+            self._slots.release()
+            self._reject(wait)
+        if wait > 0:
+            time.sleep(wait)
+        with self._lock:
+            self.active += 1
+        metrics.upstream_in_flight.inc(upstream=self.name)
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        metrics.upstream_in_flight.dec(upstream=self.name)
+        self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+                "concurrency": self.concurrency,
+                "rate_per_second": self.bucket.rate,
+            }
+
+
+def _from_env(name):
+    concurrency, rate, burst = DEFAULT_LIMITS.get(name, (8, 0, 0))
+    prefix = f"UPSTREAM_{name.upper()}_"
+    return UpstreamLimiter(
+        name,
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+        rate=float(os.getenv(prefix + "RATE", str(rate))),
+        burst=int(os.getenv(prefix + "BURST", str(burst))),
+    )
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get(name):
+    """The process-wide limiter for an upstream, configured from the environment."""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = _from_env(name)
+    return limiter
+
+
+def limit(name):
+    """Context manager holding one admitted call to upstream name."""
+    return get(name).slot()
+
+
+def stats():
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+
+def rejected_result(e, **fields):
+    """
+    Per-item result for a call that was turned away, for batch routes that
+    report errors item by item. "rejected" holds the exception so the route
+    can re-raise it when nothing in the batch got through (see
+    raise_if_all_rejected); pop it before serialising.
+    """
+    return dict(fields, status="error", error=e.public_message(), retry_after=e.retry_after, rejected=e)
+
+
+def raise_if_all_rejected(results):
+    """
+    Strip the "rejected" exceptions from results; if every result was
+    turned away, raise the one with the longest wait (answered 429/503).
+    """
+    rejected = [r.pop("rejected") for r in results if "rejected" in r]
+    if results and len(rejected) == len(results):
+        raise max(rejected, key=lambda e: e.retry_after)
+
+
+def overloaded_response(e):
+    """Flask error handler: fail fast with 429 (or 503 for an open breaker) and Retry-After."""
+    response = jsonify({"error": e.public_message(), "retry_after": e.retry_after})
+    response.status_code = e.status_code
+    response.headers["Retry-After"] = e.retry_after_header()
+    return response
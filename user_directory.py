@@ -0,0 +1,296 @@
+import hashlib
+import heapq
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Response, jsonify, request
+from dotenv import load_dotenv
+
+import circuit_breaker
+
+load_dotenv()
+
+# The whole directory is re-fetched this often in the background
+REFRESH_SECONDS = float(os.getenv("USER_DIRECTORY_REFRESH_SECONDS", "300"))
+# Older than this (e.g. a frozen serverless instance) and a request waits for a reload
+MAX_STALE_SECONDS = float(os.getenv("USER_DIRECTORY_MAX_STALE_SECONDS", str(REFRESH_SECONDS * 4)))
+PER_PAGE = int(os.getenv("USER_DIRECTORY_PER_PAGE", "200"))
+FETCH_CONCURRENCY = int(os.getenv("USER_DIRECTORY_CONCURRENCY", "4"))
+REQUEST_TIMEOUT = float(os.getenv("USER_DIRECTORY_TIMEOUT", "20"))
+# Prefixes longer than this are looked up by their first PREFIX_MAX_CHARS
+PREFIX_MAX_CHARS = 12
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+_TOKEN_SPLIT = re.compile(r"[\s@._+\-]+")
+
+
+class UserDirectoryError(Exception):
+    """Raised when the Supabase Auth admin API cannot be read."""
+
+
+def _config():
+    supabase_url = os.getenv("SUPABASE_URL")
+    # Listing users needs the service role key; the anon key is likely insufficient
+    service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY")
+    if not supabase_url or not service_key:
+        raise UserDirectoryError("Missing Supabase configuration in .env")
+    headers = {
+        "apikey": service_key,
+        "Authorization": f"Bearer {service_key}",
+        "Content-Type": "application/json"
+    }
+    # Docs: https://supabase.com/docs/reference/api/auth-admin-list-users
+    return f"{supabase_url}/auth/v1/admin/users", headers
+
+
+def format_user(u):
+    """The { id, email, name } shape the frontend expects."""
+    meta = u.get("user_metadata") or {}
+    return {
+        "id": u.get("id"),
+        "email": u.get("email"),
+        "name": meta.get("full_name") or meta.get("name") or "Student"
+    }
+
+
+def _fetch_page(session, admin_url, headers, page):
+    with circuit_breaker.guard("supabase", "auth_admin_users") as call:
+        response = session.get(
+            admin_url,
+            params={"page": page, "per_page": PER_PAGE},
+            headers=headers,
+            timeout=REQUEST_TIMEOUT
+        )
+        call.status = response.status_code
+    if response.status_code != 200:
+        raise UserDirectoryError(
+            f"Failed to fetch users from Supabase (page {page}, status {response.status_code})"
+        )
+    return response.json().get("users", []), response.headers.get("X-Total-Count")
+
+
+def fetch_all_users():
+    """
+    Page through the Auth admin API with concurrent requests.
+    Page 1 reports the total (X-Total-Count), so the remaining pages are
+    requested together; without it, pages are fetched in waves of
+    FETCH_CONCURRENCY until one comes back short.
+    """
+    admin_url, headers = _config()
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as pool:
+        first, total = _fetch_page(session, admin_url, headers, 1)
+        users = list(first)
+        if len(first) < PER_PAGE:
+            return users
+
+        if total and total.isdigit():
+            last_page = -(-int(total) // PER_PAGE)
+            pages = range(2, last_page + 1)
+            for page_users, _ in pool.map(lambda p: _fetch_page(session, admin_url, headers, p), pages):
+                users.extend(page_users)
+            return users
+
+        page = 2
+        while True:
+            wave = range(page, page + FETCH_CONCURRENCY)
+            results = list(pool.map(lambda p: _fetch_page(session, admin_url, headers, p), wave))
+            for page_users, _ in results:
+                users.extend(page_users)
+            if any(len(page_users) < PER_PAGE for page_users, _ in results):
+                return users
+            page += FETCH_CONCURRENCY
+
+
+class UserIndex:
+    """
+    Search index over a directory snapshot.
+    Word prefixes of name and email map to users for prefix matches;
+    trigrams narrow down substring matches, which are then verified.
+    Users are kept in (name, email) order so results come back sorted.
+    """
+
+    def __init__(self, users):
+        self.users = sorted(users, key=lambda u: ((u["name"] or "").lower(), u["email"] or ""))
+        self._haystacks = []
+        self._tokens = []
+        self._prefixes = defaultdict(set)
+        self._trigrams = defaultdict(set)
+        for i, u in enumerate(self.users):
+            haystack = f"{u['name'] or ''} {u['email'] or ''}".lower()
+            tokens = {t for t in _TOKEN_SPLIT.split(haystack) if t}
+            if u["email"]:
+                tokens.add(u["email"].lower())
+            self._haystacks.append(haystack)
+            self._tokens.append(tokens)
+            for token in tokens:
+                for end in range(1, min(len(token), PREFIX_MAX_CHARS) + 1):
+                    self._prefixes[token[:end]].add(i)
+            for start in range(len(haystack) - 2):
+                self._trigrams[haystack[start:start + 3]].add(i)
+
+    def _prefix_matches(self, q):
+        candidates = self._prefixes.get(q[:PREFIX_MAX_CHARS], ())
+        if len(q) <= PREFIX_MAX_CHARS:
+            return set(candidates)
+        return {i for i in candidates if any(t.startswith(q) for t in self._tokens[i])}
+
+    def _substring_matches(self, q):
+        if len(q) < 3:
+            return set()
+        postings = sorted(
+            (self._trigrams.get(q[i:i + 3], set()) for i in range(len(q) - 2)), key=len
+        )
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return {i for i in candidates if q in self._haystacks[i]}
+
+    def search(self, q, limit, offset=0):
+        """
+        Prefix matches first, then other substring matches, each in name
+        order. Returns (users, total); an empty query pages every user.
+        """
+        q = " ".join(q.lower().split())
+        if not q:
+            return self.users[offset:offset + limit], len(self.users)
+        prefix = self._prefix_matches(q)
+        substring = self._substring_matches(q) - prefix
+        # Only the requested window needs ordering, not every match
+        wanted = offset + limit
+        ranked = heapq.nsmallest(wanted, prefix)
+        if len(ranked) < wanted:
+            ranked += heapq.nsmallest(wanted - len(ranked), substring)
+        return [self.users[i] for i in ranked[offset:]], len(prefix) + len(substring)
+
+
+class UserDirectory:
+    """
+    In-memory snapshot of every user, pre-serialized with an ETag.
+    Loaded on first use, then refreshed by a background thread every
+    REFRESH_SECONDS; requests are always served from memory.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.RLock()
+        self._snapshot = None
+        self._thread = None
+        self.refreshes = 0
+        self.last_error = None
+
+    def refresh(self):
+        """Fetch the directory now and swap in the new snapshot."""
+        with self._refresh_lock:
+            started = time.time()
+            users = [format_user(u) for u in fetch_all_users()]
+            body = json.dumps(users).encode("utf-8")
+            snapshot = {
+                "users": users,
+                "body": body,
+                "etag": hashlib.sha1(body).hexdigest(),
+                "index": UserIndex(users),
+                "fetched_at": time.time(),
+            }
+            with self._lock:
+                self._snapshot = snapshot
+            self.refreshes += 1
+            self.last_error = None
+            print(f"User directory refreshed: {len(users)} users in {time.time() - started:.2f}s")
+            return snapshot
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(REFRESH_SECONDS)
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the previous snapshot
+                self.last_error = str(e)
+                print(f"User directory refresh failed: {e}")
+
+    def _start_refresh_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+                self._thread.start()
+
+    def _current(self):
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None or time.time() - snapshot["fetched_at"] > MAX_STALE_SECONDS:
+            return None
+        return snapshot
+
+    def _refresh_or_stale(self):
+        try:
+            return self.refresh()
+        except Exception as e:
+            # Supabase is failing (or its breaker is open): an old directory beats none
+            with self._lock:
+                snapshot = self._snapshot
+            if snapshot is None:
+                raise
+            self.last_error = str(e)
+            print(f"User directory refresh failed, serving the previous snapshot: {e}")
+            return snapshot
+
+    def get(self, force=False):
+        """Current snapshot; loads synchronously on first use or when too stale."""
+        snapshot = None if force else self._current()
+        if snapshot is None:
+            requested_at = time.time()
+            with self._refresh_lock:
+                # Callers that queued behind a reload reuse its result
+                snapshot = self._current()
+                if snapshot is None or snapshot["fetched_at"] < requested_at:
+                    snapshot = self._refresh_or_stale()
+        self._start_refresh_thread()
+        return snapshot
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+        return {
+            "users": len(snapshot["users"]) if snapshot else 0,
+            "age_seconds": time.time() - snapshot["fetched_at"] if snapshot else None,
+            "refreshes": self.refreshes,
+            "last_error": self.last_error,
+        }
+
+
+def search_response(snapshot, args):
+    """Handle ?q=&limit=&cursor= against the snapshot's index."""
+    try:
+        limit = min(max(int(args.get("limit", SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+        offset = max(int(args.get("cursor") or 0), 0)
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers"}), 400
+    users, total = snapshot["index"].search(args.get("q", ""), limit, offset)
+    next_offset = offset + len(users)
+    return jsonify({
+        "users": users,
+        "total": total,
+        "next_cursor": str(next_offset) if next_offset < total else None,
+    })
+
+
+def snapshot_response(snapshot):
+    """Serve the pre-serialized user list with its ETag, answering 304 on a match."""
+    headers = {"ETag": f'"{snapshot["etag"]}"', "Cache-Control": "private, no-cache"}
+    if time.time() - snapshot["fetched_at"] > MAX_STALE_SECONDS:
+        headers["Warning"] = '110 - "Response is Stale"'
+    if request.if_none_match.contains(snapshot["etag"]):
+        return Response(status=304, headers=headers)
+    return Response(snapshot["body"], headers=headers, mimetype="application/json")
+
+
+directory = UserDirectory()
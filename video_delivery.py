@@ -0,0 +1,110 @@
+import os
+from datetime import datetime, timezone
+
+from flask import Response, request
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# When a front proxy (nginx) serves the jobs directory as an internal
+# location, hand the transfer to it entirely: set this to that location's
+# URL prefix and the Python worker returns immediately.
+ACCEL_REDIRECT_PREFIX = os.getenv("VIDEO_ACCEL_REDIRECT_PREFIX", "")
+ACCEL_REDIRECT_ROOT = os.getenv("VIDEO_ACCEL_REDIRECT_ROOT", "")
+
+CHUNK_SIZE = 256 * 1024
+
+
+def _iter_range(f, length):
+    """Yield exactly length bytes from f's current position, then close it."""
+    try:
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _body(path, start, length, size):
+    """
+    Open path at start and pick the cheapest body for the server.
+    A body that runs to end-of-file goes through wsgi.file_wrapper, which
+    gunicorn turns into os.sendfile(). Gunicorn also honours Content-Length
+    on file wrappers, so bounded ranges can use the same zero-copy path.
+    """
+    f = open(path, "rb")
+    f.seek(start)
+    runs_to_eof = start + length == size
+    if runs_to_eof or request.environ.get("SERVER_SOFTWARE", "").startswith("gunicorn"):
+        return wrap_file(request.environ, f, buffer_size=CHUNK_SIZE)
+    return _iter_range(f, length)
+
+
+def _if_range_matches(etag, last_modified):
+    """True when there is no If-Range header or it still matches the file."""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified <= if_range.date
+    return True
+
+
+def send_video(path, download_name="video.mp4", cache_control="no-cache"):
+    """
+    Serve an MP4 with HTTP caching and byte-range support:
+    ETag / Last-Modified conditional requests (304), single Range requests
+    (206 / 416), and zero-copy delivery via sendfile or X-Accel-Redirect.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f"{size:x}-{stat.st_mtime_ns:x}"
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{etag}"',
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": cache_control,
+        "Content-Disposition": f'inline; filename="{download_name}"',
+    }
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return Response(status=304, headers=headers)
+
+    if ACCEL_REDIRECT_PREFIX:
+        # nginx handles Range itself for internal redirects
+        relative = os.path.relpath(path, ACCEL_REDIRECT_ROOT or os.getcwd())
+        headers["X-Accel-Redirect"] = ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + relative.replace(os.sep, "/")
+        return Response(status=200, headers=headers, mimetype="video/mp4")
+
+    start, length, status = 0, size, 200
+    requested = request.range
+    if requested is not None and _if_range_matches(etag, last_modified):
+        bounds = requested.range_for_length(size)
+        if bounds is None:
+            if len(requested.ranges) == 1:
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status=416, headers=headers)
+            # Multipart ranges are not supported; fall back to the whole file
+        else:
+            start, stop = bounds
+            length = stop - start
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    headers["Content-Length"] = str(length)
+    return Response(
+        _body(path, start, length, size),
+        status=status,
+        headers=headers,
+        mimetype="video/mp4",
+        direct_passthrough=True,
+    )
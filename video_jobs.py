@@ -0,0 +1,290 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOBS_DIR = Path(os.getenv("VIDEO_JOBS_DIR", "jobs")).resolve()
+JOBS_DB_PATH = Path(os.getenv("VIDEO_JOBS_DB", str(JOBS_DIR / "video_jobs.sqlite3"))).resolve()
+# A running job whose worker has not checked in for this long is requeued
+STALE_AFTER_SECONDS = float(os.getenv("VIDEO_JOB_STALE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("VIDEO_JOB_MAX_ATTEMPTS", "2"))
+# Finished jobs, and their directories, are kept this long for download
+JOB_RETENTION_SECONDS = float(os.getenv("VIDEO_JOB_RETENTION_HOURS", "24")) * 3600
+JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Job lifecycle: queued -> running -> done | failed
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Render tiers: a quick -ql preview followed by the -qh final render
+PREVIEW = "preview"
+FINAL = "final"
+PREVIEW_BY_DEFAULT = os.getenv("VIDEO_PREVIEW", "true").lower() in ("1", "true", "yes")
+
+_COLUMNS = (
+    "id", "status", "text", "attempts", "worker", "error", "output_path",
+    "created_at", "started_at", "heartbeat_at", "finished_at",
+    "preview", "preview_path", "timings",
+)
+
+# Columns added after the table first shipped, applied to existing databases
+_MIGRATIONS = {
+    "preview": "INTEGER NOT NULL DEFAULT 0",
+    "preview_path": "TEXT",
+    "timings": "TEXT",
+}
+
+_initialized = False
+
+
+def _connect():
+    global _initialized
+    JOBS_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # Autocommit mode; claim_next opens its own write transaction
+    conn = sqlite3.connect(str(JOBS_DB_PATH), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS video_jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " error TEXT,"
+            " output_path TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " heartbeat_at REAL,"
+            " finished_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS video_jobs_status ON video_jobs(status, created_at)")
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(video_jobs)")}
+        for column, ddl in _MIGRATIONS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE video_jobs ADD COLUMN {column} {ddl}")
+        _initialized = True
+    return conn
+
+
+def _row_to_job(row):
+    return None if row is None else {name: row[name] for name in _COLUMNS}
+
+
+def job_dir(job_id):
+    """Per-job working directory holding the script, audio and render output."""
+    path = JOBS_DIR / job_id
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def remove_intermediates(job_id):
+    """
+    Drop Manim's working tree (partial movie files, Tex, silent renders)
+    once a job has finished. The served MP4s, muxed or not, sit at the top
+    of the job directory and the silent renders are in the render cache.
+    """
+    shutil.rmtree(JOBS_DIR / job_id / "media", ignore_errors=True)
+
+
+def prune_jobs():
+    """
+    Delete jobs that finished before the retention window, with their
+    directories, and job directories whose job is gone.
+    Returns the number of jobs removed.
+    """
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    with closing(_connect()) as conn:
+        expired = [row["id"] for row in conn.execute(
+            "SELECT id FROM video_jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (DONE, FAILED, cutoff)
+        )]
+        conn.executemany("DELETE FROM video_jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        known = {row["id"] for row in conn.execute("SELECT id FROM video_jobs")}
+
+    for job_id in expired:
+        shutil.rmtree(JOBS_DIR / job_id, ignore_errors=True)
+    for entry in (os.scandir(JOBS_DIR) if JOBS_DIR.is_dir() else ()):
+        if not entry.is_dir() or not JOB_ID_RE.match(entry.name) or entry.name in known:
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+    return len(expired)
+
+
+def enqueue(text, preview=None):
+    """Add a render job to the queue and return it."""
+    job_id = uuid.uuid4().hex
+    preview = PREVIEW_BY_DEFAULT if preview is None else preview
+    with closing(_connect()) as conn:
+        conn.execute(
+            "INSERT INTO video_jobs (id, status, text, preview, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, QUEUED, text, int(bool(preview)), time.time())
+        )
+    return get_job(job_id)
+
+
+def get_job(job_id):
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM video_jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row)
+
+
+def latest_job():
+    """The most recently submitted job, whatever its state."""
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM video_jobs ORDER BY created_at DESC LIMIT 1").fetchone()
+    return _row_to_job(row)
+
+
+def claim_next(worker_id):
+    """Atomically move the oldest queued job to running and return it."""
+    now = time.time()
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM video_jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE video_jobs SET status = ?, worker = ?, attempts = attempts + 1,"
+                " started_at = ?, heartbeat_at = ?, error = NULL WHERE id = ?",
+                (RUNNING, worker_id, now, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return get_job(row["id"])
+
+
+def heartbeat(job_id):
+    with closing(_connect()) as conn:
+        conn.execute(
+            "UPDATE video_jobs SET heartbeat_at = ? WHERE id = ? AND status = ?",
+            (time.time(), job_id, RUNNING)
+        )
+
+
+def set_preview(job_id, preview_path):
+    """Record that the low-quality preview is ready while the final renders."""
+    with closing(_connect()) as conn:
+        conn.execute(
+            "UPDATE video_jobs SET preview_path = ?, heartbeat_at = ? WHERE id = ?",
+            (str(preview_path), time.time(), job_id)
+        )
+
+
+def available_tiers(job):
+    """Render tiers that can be served for this job right now, best last."""
+    tiers = []
+    if job["preview_path"] and Path(job["preview_path"]).exists():
+        tiers.append(PREVIEW)
+    if job["status"] == DONE and job["output_path"] and Path(job["output_path"]).exists():
+        tiers.append(FINAL)
+    return tiers
+
+
+def video_path_for(job, tier):
+    """
+    Resolve a requested tier ("preview", "final" or "best") to
+    (tier, path), or (None, None) when it is not available yet.
+    """
+    tiers = available_tiers(job)
+    if tier == "best":
+        tier = tiers[-1] if tiers else None
+    if tier not in tiers:
+        return None, None
+    return tier, Path(job["preview_path"] if tier == PREVIEW else job["output_path"])
+
+
+def complete(job_id, output_path, timings=None):
+    with closing(_connect()) as conn:
+        conn.execute(
+            "UPDATE video_jobs SET status = ?, output_path = ?, timings = ?, finished_at = ? WHERE id = ?",
+            (DONE, str(output_path), json.dumps(timings) if timings else None, time.time(), job_id)
+        )
+
+
+def fail(job_id, error):
+    with closing(_connect()) as conn:
+        conn.execute(
+            "UPDATE video_jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (FAILED, str(error), time.time(), job_id)
+        )
+
+
+def requeue_stale():
+    """
+    Recover jobs left running by a worker that died. They go back on the
+    queue, or are marked failed once they have used up MAX_ATTEMPTS.
+    Returns the number of jobs touched.
+    """
+    cutoff = time.time() - STALE_AFTER_SECONDS
+    with closing(_connect()) as conn:
+        failed = conn.execute(
+            "UPDATE video_jobs SET status = ?, error = ?, finished_at = ?"
+            " WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+            (FAILED, "Worker stopped responding", time.time(), RUNNING, cutoff, MAX_ATTEMPTS)
+        ).rowcount
+        requeued = conn.execute(
+            "UPDATE video_jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ?",
+            (QUEUED, RUNNING, cutoff)
+        ).rowcount
+    return failed + requeued
+
+
+def queue_position(job_id):
+    """How many queued jobs are ahead of this one (0 means next up)."""
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM video_jobs WHERE status = ?"
+            " AND created_at < (SELECT created_at FROM video_jobs WHERE id = ?)",
+            (QUEUED, job_id)
+        ).fetchone()
+    return row[0]
+
+
+def public_view(job):
+    """Job fields that are safe to return to the client."""
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["status"] == QUEUED:
+        view["queue_position"] = queue_position(job["id"])
+    if job["status"] == FAILED:
+        view["error"] = job["error"]
+    if job["timings"]:
+        view["timings"] = json.loads(job["timings"])
+    tiers = available_tiers(job)
+    view["tiers_available"] = tiers
+    view["tier"] = tiers[-1] if tiers else None
+    if PREVIEW in tiers:
+        view["preview_url"] = f"/video-jobs/{job['id']}/result?tier={PREVIEW}"
+    if FINAL in tiers:
+        view["result_url"] = f"/video-jobs/{job['id']}/result"
+    return view
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import llm_client
+import metrics
+from cache import FileCache
+from voiceover import build_voiceover
+
+PROJECT_ROOT = Path(__file__).parent
+VIDEO_PROMPT_PATH = PROJECT_ROOT / "src" / "assets" / "video_prompt.txt"
+
+SCRIPT_NAME = "generated_manim_script.py"
+SCENE_NAME = "Explainer"
+
+ADD_SOUND_RE = re.compile(r"^[ \t]*self\.add_sound\(.*\)[ \t]*\n?", re.MULTILINE)
+
+# Manim quality flag -> output folder it renders into
+QUALITY_DIRS = {"l": "480p15", "m": "720p30", "h": "1080p60", "p": "1440p60", "k": "2160p60"}
+
+render_cache = FileCache(
+    os.getenv("RENDER_CACHE_DIR", "cache/renders"),
+    max_bytes=int(os.getenv("RENDER_CACHE_MAX_MB", "2048")) * 1024 * 1024,
+    suffix=".mp4",
+)
+
+
+def find_manim():
+    """Prefer the project's .venv Manim, fall back to one on PATH (Docker)."""
+    venv_manim = PROJECT_ROOT / ".venv" / "bin" / "manim"
+    if venv_manim.exists():
+        return str(venv_manim)
+    path_manim = shutil.which("manim")
+    if path_manim:
+        return path_manim
+    raise RuntimeError("Manim is not installed inside .venv or on PATH.")
+
+
+def rendered_video_path(job_dir, quality="h"):
+    """Where Manim writes the render for a quality flag when run from job_dir."""
+    return Path(job_dir) / "media" / "videos" / Path(SCRIPT_NAME).stem / QUALITY_DIRS[quality] / f"{SCENE_NAME}.mp4"
+
+
+def render_cache_key(script_text, quality):
+    """
+    Identify a render by everything that affects its output. Renders are
+    silent (narration is muxed in afterwards), so audio is not part of it.
+    """
+    script_hash = hashlib.sha256(script_text.encode("utf-8")).hexdigest()
+    return f"{quality}:{script_hash}:silent"
+
+
+def render_script(job_dir, script_text, quality="h"):
+    """
+    Render the Explainer scene in job_dir, reusing a cached MP4 when the
+    same script was rendered before at this quality.
+    Returns the path of the MP4.
+    """
+    job_dir = Path(job_dir)
+    output_path = rendered_video_path(job_dir, quality)
+    key = render_cache_key(script_text, quality)
+
+    if render_cache.get_file(key, output_path):
+        print(f"Render cache hit ({quality}), skipping Manim")
+        return output_path
+
+    # Run from job_dir so media/ is created inside the job
+    with metrics.track("manim", f"render_q{quality}"):
+        subprocess.run(
+            [
+                find_manim(),
+                f"-q{quality}",
+                SCRIPT_NAME,
+                SCENE_NAME
+            ],
+            cwd=job_dir,
+            check=True
+        )
+
+    if not output_path.exists():
+        raise RuntimeError(f"Manim finished but {output_path} was not produced.")
+    render_cache.put_file(key, output_path)
+    return output_path
+
+
+def convert_to_latex(text):
+    return llm_client.complete(
+        '''Convert the text below into a LaTeX document.
+                After converting, carefully review the text and correct any mistakes
+                or misread characters. Preserve formatting like bullet points,
+                headings, or mathematical notation where possible.
+                Do not include any other extra text like 'okay here's your message' or something similar. ONLY include the extracted LaTeX output.''' + text,
+        site="latex",
+    )
+
+
+def sanitize_text(user_text):
+    """Strip characters that break the LaTeX Manim renders."""
+    if user_text:
+        user_text = user_text.replace("&", "and").replace("%", " percent ")
+    return user_text
+
+
+def parse_llm_output(llm_output):
+    """Split the script LLM's reply into (voice_text or None, script_text)."""
+    voice_text = None
+    if "VOICEOVER_SCRIPT" in llm_output and "END_VOICEOVER" in llm_output:
+        voice_part = llm_output.split("VOICEOVER_SCRIPT", 1)[1]
+        voice_text = voice_part.split("END_VOICEOVER", 1)[0].strip() or None
+    else:
+        print("No VOICEOVER_SCRIPT found in LLM output.")
+
+    if "Manim" not in llm_output:
+        raise ValueError("LLM did not return a valid script with 'Manim' marker.")
+
+    script_text = llm_output.split("Manim", 1)[1].strip()
+
+    # Remove code fences (``` or ```python)
+    if script_text.startswith("```"):
+        # Split by newline after the first ``` line
+        lines = script_text.splitlines()
+        if lines[0].startswith("```"):
+            lines = lines[1:]  # remove opening ```
+        if lines[-1].startswith("```"):
+            lines = lines[:-1]  # remove closing ```
+        script_text = "\n".join(lines).strip()
+
+    # Audio is muxed in after rendering, so the scene renders silent
+    script_text = ADD_SOUND_RE.sub("", script_text)
+    return voice_text, script_text
+
+
+@contextmanager
+def _stage(stages, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = round(time.perf_counter() - started, 3)
+
+
+def _build_audio(voice_text, voiceover_path, stages):
+    """TTS stage; returns the MP3 path, or None so the video ships silent."""
+    try:
+        with _stage(stages, "tts"):
+            # Generate MP3 using gTTS (chunked, concurrent, cached) sped up to 1.5x
+            print(f"Generating voiceover ({len(voice_text)} chars) with gTTS...")
+            build_voiceover(voice_text, voiceover_path, lang='en')
+    except Exception as e:
+        print(f"Error generating voiceover: {e}")
+        return None
+
+    # Verify file exists and has content
+    if voiceover_path.exists() and voiceover_path.stat().st_size > 0:
+        print(f"{voiceover_path} saved successfully. Size: {voiceover_path.stat().st_size} bytes")
+        return voiceover_path
+    print(f"Error: {voiceover_path} is empty or missing.")
+    return None
+
+
+def mux_audio(video_path, audio_path, dest_path):
+    """
+    Copy the rendered video stream and add the narration as AAC. The audio
+    is padded with silence and cut at the video's end, matching how
+    add_sound behaved, and the moov atom is moved up front for streaming.
+    """
+    with metrics.track("ffmpeg", "mux"):
+        subprocess.run([
+            'ffmpeg', '-y', '-i', str(video_path), '-i', str(audio_path),
+            '-map', '0:v:0', '-map', '1:a:0',
+            '-c:v', 'copy', '-c:a', 'aac', '-af', 'apad', '-shortest',
+            '-movflags', '+faststart',
+            str(dest_path)
+        ], check=True, capture_output=True)
+    return Path(dest_path)
+
+
+def _finish(silent_path, audio_future, dest_path, stages, stage_name):
+    """
+    Wait for the TTS stage and mux its audio into a silent render at
+    dest_path. Without audio the render itself is moved there, so the
+    served MP4 never lives under Manim's media/ tree.
+    """
+    audio_path = audio_future.result() if audio_future else None
+    if audio_path is None:
+        return Path(shutil.move(str(silent_path), str(dest_path)))
+    with _stage(stages, stage_name):
+        return mux_audio(silent_path, audio_path, dest_path)
+
+
+def createVideo(user_text_here, job_dir, preview=False, on_preview=None, timings=None):
+    """
+    Generate a narrated Manim explainer for user_text_here.
+    Everything (script, voiceover, render) is written inside job_dir so
+    concurrent jobs never touch each other's files.
+
+    Stages: LaTeX conversion -> script LLM call -> (TTS in parallel with the
+    Manim renders) -> mux audio into each render. With preview=True a fast
+    -ql render is muxed and handed to on_preview(path) while the 1080p60
+    render is already running.
+
+    If a timings dict is passed it is filled with per-stage durations, the
+    wall-clock total and the time saved versus running the stages in order.
+    Returns the path of the final MP4.
+    """
+    job_dir = Path(job_dir)
+    timings = {} if timings is None else timings
+    stages = timings.setdefault("stages", {})
+    started = time.perf_counter()
+
+    with open(VIDEO_PROMPT_PATH, "r") as file:
+        content = file.read()
+
+    with _stage(stages, "latex"):
+        latex = convert_to_latex(user_text_here)
+    with _stage(stages, "script"):
+        data = llm_client.chat_completion([{"role": "user", "content": content + latex}], site="script")
+
+    print("API Response:", json.dumps(data, indent=2))
+
+    voice_text, script_text = parse_llm_output(data["choices"][0]["message"]["content"])
+
+    with open(job_dir / SCRIPT_NAME, "w", encoding="utf-8") as f:
+        f.write(script_text)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        audio_future = None
+        if voice_text:
+            audio_future = pool.submit(_build_audio, voice_text, job_dir / "voiceover.mp3", stages)
+
+        if preview:
+            try:
+                with _stage(stages, "render_preview"):
+                    silent_preview = render_script(job_dir, script_text, "l")
+            except subprocess.CalledProcessError as e:
+                # The final render may still succeed, so a failed preview is not fatal
+                print(f"Preview render failed: {e}")
+            else:
+                # Mux the preview off the main thread so the final render starts now
+                def publish_preview():
+                    try:
+                        path = _finish(silent_preview, audio_future, job_dir / f"{SCENE_NAME}_preview.mp4",
+                                       stages, "mux_preview")
+                        if on_preview:
+                            on_preview(path)
+                    except Exception as e:
+                        print(f"Preview mux failed: {e}")
+                pool.submit(publish_preview)
+
+        with _stage(stages, "render_final"):
+            silent_final = render_script(job_dir, script_text, "h")
+        output_path = _finish(silent_final, audio_future, job_dir / f"{SCENE_NAME}.mp4", stages, "mux_final")
+
+    print("==== Extracted Script Start ====")
+    print(script_text[:200])  # first 200 chars
+    print("==== Extracted Script End ====")
+
+    wall = time.perf_counter() - started
+    sequential = sum(stages.values())
+    timings["wall_seconds"] = round(wall, 3)
+    timings["sequential_seconds"] = round(sequential, 3)
+    timings["saved_seconds"] = round(max(0.0, sequential - wall), 3)
+    print(f"Video pipeline took {wall:.1f}s, saved {timings['saved_seconds']:.1f}s by overlapping stages")
+    return output_path
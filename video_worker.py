@@ -0,0 +1,108 @@
+"""
+Render worker for queued video jobs.
+
+Run it next to the web process:
+    python video_worker.py
+
+It claims jobs from the SQLite queue in video_jobs.py, renders each one in
+its own job directory and records the result. VIDEO_WORKERS bounds how many
+Manim renders run at once.
+"""
+import os
+import socket
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import video_jobs
+import video_pipeline
+
+load_dotenv()
+
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "1"))
+POLL_INTERVAL = float(os.getenv("VIDEO_WORKER_POLL_SECONDS", "1"))
+HEARTBEAT_INTERVAL = float(os.getenv("VIDEO_WORKER_HEARTBEAT_SECONDS", "30"))
+STALE_CHECK_INTERVAL = 60
+PRUNE_INTERVAL = 3600
+
+
+def _keep_alive(job_id, stop):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        video_jobs.heartbeat(job_id)
+
+
+def run_job(job):
+    """Render one claimed job and record success or failure."""
+    job_id = job["id"]
+    print(f"Starting video job {job_id} (attempt {job['attempts']})")
+
+    stop = threading.Event()
+    beat = threading.Thread(target=_keep_alive, args=(job_id, stop), daemon=True)
+    beat.start()
+    timings = {}
+    try:
+        output_path = video_pipeline.createVideo(
+            video_pipeline.sanitize_text(job["text"]),
+            video_jobs.job_dir(job_id),
+            preview=bool(job["preview"]),
+            on_preview=lambda path: video_jobs.set_preview(job_id, path),
+            timings=timings
+        )
+        video_jobs.complete(job_id, output_path, timings)
+        print(f"Video job {job_id} finished: {output_path}")
+    except Exception as e:
+        print(f"Error generating video for job {job_id}:", e)
+        video_jobs.fail(job_id, e)
+    finally:
+        stop.set()
+        video_jobs.remove_intermediates(job_id)
+
+
+def worker_loop(worker_id, stop):
+    last_stale_check = 0.0
+    last_prune = 0.0
+    while not stop.is_set():
+        if time.time() - last_stale_check > STALE_CHECK_INTERVAL:
+            recovered = video_jobs.requeue_stale()
+            if recovered:
+                print(f"Recovered {recovered} stale video job(s)")
+            last_stale_check = time.time()
+        if time.time() - last_prune > PRUNE_INTERVAL:
+            pruned = video_jobs.prune_jobs()
+            if pruned:
+                print(f"Removed {pruned} expired video job(s)")
+            last_prune = time.time()
+
+        job = video_jobs.claim_next(worker_id)
+        if job is None:
+            stop.wait(POLL_INTERVAL)
+            continue
+        run_job(job)
+
+
+def start_workers(count=None):
+    """Start the render pool in background threads; returns the stop event."""
+    stop = threading.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    for i in range(count or VIDEO_WORKERS):
+        thread = threading.Thread(
+            target=worker_loop, args=(f"{prefix}:{i}", stop), daemon=True
+        )
+        thread.start()
+    return stop
+
+
+def main():
+    print(f"Video worker starting with {VIDEO_WORKERS} render slot(s)")
+    stop = start_workers()
+    try:
+        while not stop.is_set():
+            stop.wait(3600)
+    except KeyboardInterrupt:
+        print("Video worker shutting down")
+        stop.set()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import hashlib
+import io
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from gtts import gTTS
+from dotenv import load_dotenv
+
+import metrics
+from cache import FileCache
+
+load_dotenv()
+
+VOICEOVER_TEMPO = float(os.getenv("VOICEOVER_TEMPO", "1.5"))
+# gTTS requests for one narration that may be in flight at once
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+# Sentences are packed into chunks of roughly this many characters
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "200"))
+
+audio_cache = FileCache(
+    os.getenv("AUDIO_CACHE_DIR", "cache/audio"),
+    max_bytes=int(os.getenv("AUDIO_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    suffix=".mp3",
+)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def split_sentences(text, max_chars=None):
+    """Pack whole sentences into chunks of at most max_chars where possible."""
+    max_chars = max_chars or TTS_CHUNK_CHARS
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _synthesize_chunk(chunk, lang):
+    buffer = io.BytesIO()
+    with metrics.track("gtts", "synthesize"):
+        gTTS(text=chunk, lang=lang, slow=False).write_to_fp(buffer)
+    return buffer.getvalue()
+
+
+def synthesize(text, lang="en"):
+    """
+    Run gTTS over sentence chunks concurrently and join the MP3 streams in
+    order. MP3 frames concatenate cleanly, which is also how gTTS joins
+    its own internal chunks.
+    """
+    chunks = split_sentences(text)
+    if not chunks:
+        raise ValueError("No text to synthesize")
+    workers = max(1, min(TTS_CONCURRENCY, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return b"".join(pool.map(lambda chunk: _synthesize_chunk(chunk, lang), chunks))
+
+
+def apply_tempo(mp3_bytes, tempo, dest_path):
+    """Tempo-adjust in a single ffmpeg pass fed from memory (no temp file)."""
+    if tempo == 1.0:
+        Path(dest_path).write_bytes(mp3_bytes)
+        return
+    with metrics.track("ffmpeg", "atempo"):
+        subprocess.run([
+            'ffmpeg', '-y', '-f', 'mp3', '-i', 'pipe:0',
+            '-filter:a', f'atempo={tempo}',
+            str(dest_path)
+        ], input=mp3_bytes, check=True, capture_output=True)
+
+
+def cache_key(text, lang, tempo):
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{lang}:{tempo}:{digest}"
+
+
+def build_voiceover(text, dest_path, lang="en", tempo=None):
+    """
+    Write the narration for text to dest_path, reusing cached audio for the
+    same (text, lang, tempo). Returns True if it came from the cache.
+    """
+    tempo = VOICEOVER_TEMPO if tempo is None else tempo
+    key = cache_key(text, lang, tempo)
+    if audio_cache.get_file(key, str(dest_path)):
+        print(f"Voiceover cache hit ({len(text)} chars)")
+        return True
+
+    apply_tempo(synthesize(text, lang), tempo, dest_path)
+    audio_cache.put_file(key, str(dest_path))
+    return False